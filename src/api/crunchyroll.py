@@ -1,11 +1,12 @@
 """ Extending crunchyroll api implemented in streamlink
 """
-import json
 from enum import Enum
 from typing import Optional, Dict, Any, List
 
 import requests
-from streamlink.session import Streamlink
+
+from metrics import registry as metrics
+from api.search_index import SearchCandidates, iter_series, CHUNK_SIZE
 
 
 class MediaType(Enum):
@@ -38,6 +39,8 @@ class CrunchyrollAPI:
     def _create_api(username: str, password: str):
         """ Creates and returns the CR api from streamlink
         """
+        # streamlink is slow to import, only pay for it when logging in
+        from streamlink.session import Streamlink
         session = Streamlink()
         session.set_loglevel("debug")
         plugin = session.get_plugins()['crunchyroll']('')
@@ -45,10 +48,15 @@ class CrunchyrollAPI:
         plugin.options.set('password', password)
         return plugin._create_api()
 
-    def __init__(self, username: str, password: str) -> None:
-        self._api = CrunchyrollAPI._create_api(username, password)
-        self._search_candidates: Optional[list] = None
+    def __init__(self, username: Optional[str] = None, password: Optional[str] = None,
+                 cache_dir: Optional[str] = None, backend: Optional[Any] = None) -> None:
+        # backend stands in for streamlink's API (see replay.py), no login then
+        self._api = backend if backend is not None else CrunchyrollAPI._create_api(username, password)
+        # search candidates are kept on disk (and mmapped) when there is a cache_dir
+        self._search_store = SearchCandidates(cache_dir) if cache_dir else None
+        self._search_candidates = None
 
+    @metrics.timed("api.list_series")
     def list_series(self,
                     media_type: MediaType,
                     search_filter: Filters,
@@ -58,7 +66,7 @@ class CrunchyrollAPI:
         """ Returns a list of series given filter constraints
         """
         params: Dict[str, Any] = {
-            "media_type": media_type,
+            "media_type": media_type.value,
             "filter": search_filter.value + (search_filter_param if search_filter_param else ""),
         }
 
@@ -69,6 +77,7 @@ class CrunchyrollAPI:
 
         return self._api._api_call("list_series", params)
 
+    @metrics.timed("api.list_collections")
     def list_collections(self,
                          series_id: str,
                          sort: Optional[SortOption] = None,
@@ -89,6 +98,7 @@ class CrunchyrollAPI:
 
         return self._api._api_call("list_collections", params)
 
+    @metrics.timed("api.list_media")
     def list_media(self,
                    series_id: str,
                    sort: Optional[SortOption] = None,
@@ -112,14 +122,24 @@ class CrunchyrollAPI:
 
         return self._api._api_call("list_media", params)
 
+    @metrics.timed("api.list_search_candidates")
     def list_search_candidates(self) -> list:
         """ Returns a list of search candidates (Series)
         """
-        res = requests.get(CR_AJAX_ANIME_LIST)
-        data = json.loads(res.text[len('/*-secure-'):-len('*/')])['data']
-        series = [elt for elt in data if elt['type'] == 'Series']
-        return series
+        return list(self._get_search_candidates())
 
+    def _get_search_candidates(self):
+        """ Search candidates, streamed and parsed as they download. With a
+        cache_dir they come from the revalidated on-disk index """
+        if self._search_candidates is None:
+            if self._search_store is not None:
+                self._search_candidates = self._search_store.load(requests, CR_AJAX_ANIME_LIST)
+            else:
+                with requests.get(CR_AJAX_ANIME_LIST, stream=True) as res:
+                    self._search_candidates = list(iter_series(res.iter_content(CHUNK_SIZE)))
+        return self._search_candidates
+
+    @metrics.timed("api.get_queue")
     def get_queue(self, media_types: MediaType, fields: Optional[List[str]] = None):
         """ Return queue
         """
@@ -134,17 +154,22 @@ class CrunchyrollAPI:
 
     def search(self, search_term: str) -> List[str]:
         """ Search anime """
-        results = []
-        if self._search_candidates is None:
-            self._search_candidates = self.list_search_candidates()
+        candidates = self._get_search_candidates()
+        if hasattr(candidates, "search"):
+            return candidates.search(search_term)
 
         search_term = search_term.lower()
-        for series in self._search_candidates:
-            if search_term in series['name'].lower():
-                results.append(series)
+        return [series for series in candidates if search_term in series['name'].lower()]
 
-        return results
+    @metrics.timed("api.add_to_queue")
+    def add_to_queue(self, series_id: str):
+        """ Add series to queue """
+        params = {
+            "series_id": series_id
+        }
+        return self._api._api_call("add_to_queue", params)
 
+    @metrics.timed("api.remove_from_queue")
     def remove_from_queue(self, series_id: str):
         """ Delete series from queue """
         params = {
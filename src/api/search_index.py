@@ -0,0 +1,188 @@
+""" Search candidates (every series on Crunchyroll, from RpcApiSearch) kept on
+disk in a compact binary file that is memory-mapped on load
+
+The payload is parsed incrementally while it downloads, and only the fields
+in FIELDS of the Series entries are kept. File layout (native byte order):
+
+    header              MAGIC, count, size of the names blob
+    name offsets        count + 1 uint32 offsets into the names blob
+    record offsets      count + 1 uint32 offsets into the records blob
+    names blob          lower cased names, each followed by a newline
+    records blob        FIELDS joined by \\x1f, utf-8
+"""
+import os
+import json
+import mmap
+import array
+import bisect
+import codecs
+import struct
+import logging
+from typing import Iterable, Iterator, List
+
+MAGIC = b"CRS1"
+HEADER = struct.Struct("=4sII")
+FIELDS = ("id", "name", "link")
+SEPARATOR = "\x1f"
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_series(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """ Series entries of a RpcApiSearch payload, parsed as the chunks arrive.
+    Only the end of the buffer that isn't parsed yet is kept around """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    in_data = False
+    for chunk in chunks:
+        buf += text_decoder.decode(chunk)
+        pos = 0
+        if not in_data:
+            start = buf.find('"data"')
+            if start < 0:
+                # keep enough to find the key across chunk boundaries
+                buf = buf[-len('"data"'):]
+                continue
+            start = buf.find("[", start)
+            if start < 0:
+                continue
+            in_data = True
+            pos = start + 1
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buf):
+                break
+            if buf[pos] == "]":
+                return
+            try:
+                entry, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # entry continues in the next chunk
+                break
+            pos = end
+            if entry.get("type") == "Series":
+                yield {field: entry.get(field) or "" for field in FIELDS}
+        buf = buf[pos:]
+
+
+def write_index(path: str, series_list: Iterable[dict]) -> int:
+    """ Write series to path, atomically. Returns the number written """
+    name_offsets = array.array("I", [0])
+    record_offsets = array.array("I", [0])
+    names = bytearray()
+    records = bytearray()
+    for series in series_list:
+        names += series["name"].lower().replace("\n", " ").encode() + b"\n"
+        records += SEPARATOR.join(series[field].replace(SEPARATOR, " ") for field in FIELDS).encode()
+        name_offsets.append(len(names))
+        record_offsets.append(len(records))
+    count = len(name_offsets) - 1
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as index_file:
+        index_file.write(HEADER.pack(MAGIC, count, len(names)))
+        name_offsets.tofile(index_file)
+        record_offsets.tofile(index_file)
+        index_file.write(names)
+        index_file.write(records)
+    os.replace(tmp_path, path)
+    return count
+
+
+class SearchIndex:
+    """ Read-only view of a file written by write_index. Records are decoded
+    only when they are looked at
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as index_file:
+            self._mm = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, names_size = HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            raise ValueError("Not a search index: " + path)
+        view = memoryview(self._mm)
+        offsets_size = 4 * (self.count + 1)
+        start = HEADER.size
+        self._name_offsets = view[start:start + offsets_size].cast("I")
+        start += offsets_size
+        self._record_offsets = view[start:start + offsets_size].cast("I")
+        start += offsets_size
+        self._names_start = start
+        self._records_start = start + names_size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, idx: int) -> dict:
+        start = self._records_start + self._record_offsets[idx]
+        end = self._records_start + self._record_offsets[idx + 1]
+        values = self._mm[start:end].decode().split(SEPARATOR)
+        record = dict(zip(FIELDS, values))
+        record["type"] = "Series"
+        return record
+
+    def __iter__(self) -> Iterator[dict]:
+        return (self[idx] for idx in range(self.count))
+
+    def search(self, term: str) -> List[dict]:
+        """ Series whose name contains term, case insensitive """
+        needle = term.lower().encode()
+        end = self._records_start
+        matches = []
+        pos = self._mm.find(needle, self._names_start, end) if needle else -1
+        while pos >= 0:
+            idx = bisect.bisect_right(self._name_offsets, pos - self._names_start) - 1
+            matches.append(self[idx])
+            # continue after the name that matched
+            next_name = self._names_start + self._name_offsets[idx + 1]
+            pos = self._mm.find(needle, next_name, end)
+        return matches
+
+
+class SearchCandidates:
+    """ The on-disk index plus the validators (ETag/Last-Modified) of the
+    response it was built from, so it is only downloaded again when it changed
+    """
+
+    def __init__(self, cache_dir: str):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.path = os.path.join(cache_dir, "search_candidates.bin")
+        self.meta_path = self.path + ".json"
+
+    def _validators(self) -> dict:
+        try:
+            with open(self.meta_path) as meta_file:
+                return json.load(meta_file)
+        except Exception:
+            return {}
+
+    def load(self, session, url: str) -> SearchIndex:
+        """ Revalidate the index against url and return it. Falls back to the
+        file on disk if the request fails """
+        have_index = os.path.exists(self.path)
+        headers = {}
+        if have_index:
+            validators = self._validators()
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+        try:
+            with session.get(url, headers=headers, stream=True) as res:
+                if res.status_code == 304 and have_index:
+                    logging.info("Search candidates not modified")
+                    return SearchIndex(self.path)
+                res.raise_for_status()
+                count = write_index(self.path, iter_series(res.iter_content(CHUNK_SIZE)))
+                with open(self.meta_path, "w") as meta_file:
+                    json.dump({
+                        "etag": res.headers.get("ETag"),
+                        "last_modified": res.headers.get("Last-Modified"),
+                    }, meta_file)
+                logging.info("Stored %d search candidates", count)
+        except Exception as exp:
+            if not have_index:
+                raise
+            logging.warning("Couldn't revalidate search candidates, using the stored ones: %s", str(exp))
+        return SearchIndex(self.path)
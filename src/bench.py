@@ -0,0 +1,142 @@
+""" Rendering benchmarks on the headless backend
+
+    $ python bench.py [--json]
+"""
+import sys
+import json
+import time
+import logging
+import threading
+
+import gui
+import headless
+from gui import App, BaseLayout, VerticalLayout, HorizontalLayout, ContainerWidget, Value, ValueType
+from gui import BrowserWidget, ItemWidget, LogWidget, Table, Row
+
+
+class BenchApp(App):
+    """ Same layout as MyApp, without the API behind it
+    """
+    def __init__(self, backend: headless.HeadlessCurses):
+        super().__init__(backend.stdscr, BaseLayout(Value(backend.COLS), Value(backend.LINES), None))
+        main_container = ContainerWidget(self.root, False, "bench", center=True)
+        l4 = VerticalLayout(Value(1, ValueType.VAL_RELATIVE), Value(1, ValueType.VAL_RELATIVE), main_container)
+        l1 = HorizontalLayout(Value(1, ValueType.VAL_RELATIVE), Value(0.8, ValueType.VAL_RELATIVE), l4)
+        l2 = BaseLayout(Value(0.3, ValueType.VAL_RELATIVE), Value(1, ValueType.VAL_RELATIVE), l1)
+        l5 = BaseLayout(Value(1, ValueType.VAL_RELATIVE), Value(-1, ValueType.VAL_ABSOLUTE), l4)
+        self.set_log_widget(LogWidget(ContainerWidget(l5, True, "Log")))
+        self.anime_list_widget = BrowserWidget(ContainerWidget(l2, True, "Anime"))
+        self.episode_list_widget = BrowserWidget(ContainerWidget(l1, True, "Episodes"))
+        self.set_control(self.anime_list_widget)
+        self.root.redraw()
+
+
+def _measure(name, backend, func):
+    backend.stats.reset()
+    start = time.perf_counter()
+    func()
+    result = {"name": name, "total_ms": 1000 * (time.perf_counter() - start)}
+    result.update(backend.stats.summary())
+    return result
+
+
+def bench_scroll(backend, app, rows=10000):
+    """ Scroll through a long list, one key per frame and held down """
+    for idx in range(rows):
+        ItemWidget(app.anime_list_widget, "Anime #%d" % idx, idx)
+    app.anime_list_widget.redraw()
+
+    def _run():
+        for _ in range(500):
+            headless.press(app, ["j"])
+        for _ in range(100):
+            headless.press(app, ["KEY_DOWN"] * 30)
+
+    return _measure("scroll %d rows" % rows, backend, _run)
+
+
+def _episode_rows(table, texts):
+    """ Rows the way MyApp._patch_episode_rows lays them out, a header per season """
+    rows = []
+    for idx, text in enumerate(texts):
+        if idx % 100 == 0:
+            rows.append(Row(("collection", idx // 100, idx), "Season %d" % (idx // 100 + 1), selectable=False))
+        rows.append(Row(idx, text, idx))
+    return rows
+
+
+def bench_open_series(backend, app, episodes=1000, refreshes=50):
+    """ Open a long series like MyApp.show_episodes (Table + patch_children),
+    then mark episodes watched one by one like refresh_episodes """
+    widget = app.episode_list_widget
+    table = Table(3, padding=3, min_widths=(0, 1, 0))
+    texts = []
+
+    def _open():
+        widget.clear_children()
+        for idx in range(episodes):
+            table.append((str(idx + 1), "", "エピソード %d: episode title" % idx))
+        texts.extend(table.render())
+        widget.patch_children(_episode_rows(table, texts))
+
+    def _watched(idx):
+        def _patch():
+            if table.set_row(idx, (str(idx + 1), "\u2713", "エピソード %d: episode title" % idx)):
+                texts[:] = table.render()
+            else:
+                texts[idx] = table.render_row(idx)
+            widget.patch_children(_episode_rows(table, texts))
+        return _patch
+
+    def _run():
+        headless.frame(app, _open)
+        for idx in range(refreshes):
+            headless.frame(app, _watched(idx))
+
+    return _measure("open %d episode series" % episodes, backend, _run)
+
+
+def bench_log_burst(backend, app, lines=2000, threads=4):
+    """ Log from worker threads while the loop is running """
+    handler = logging.Handler()
+    handler.emit = lambda record: app.log(record.getMessage())
+    logger = logging.getLogger("bench")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+
+    def _log():
+        for idx in range(lines // threads):
+            logger.info("log line %d", idx)
+
+    def _run():
+        workers = [threading.Thread(target=_log) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        while any(worker.is_alive() for worker in workers):
+            headless.run_for(app, 0.01)
+        headless.run_for(app, 2 / LogWidget.MAX_FPS)
+
+    return _measure("log burst %d lines" % lines, backend, _run)
+
+
+def main():
+    backend = headless.HeadlessCurses(lines=50, cols=160)
+    gui.use_backend(backend)
+    app = BenchApp(backend)
+    results = [
+        bench_scroll(backend, app),
+        bench_open_series(backend, app),
+        bench_log_burst(backend, app),
+    ]
+    if "--json" in sys.argv:
+        print(json.dumps(results, indent=2))
+        return
+    columns = ["total_ms", "frames", "frame_ms_avg", "frame_ms_max", "windows_created", "refreshes", "cells_written"]
+    print("%-28s" % "benchmark" + "".join("%16s" % col for col in columns))
+    for result in results:
+        print("%-28s" % result["name"] + "".join("%16.1f" % result[col] for col in columns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+""" On-disk snapshots of API responses, used to show something before the
+network answers
+"""
+import os
+import json
+import logging
+from typing import Any, Optional
+
+from metrics import registry as metrics
+
+
+class SnapshotCache:
+    """ Stores one JSON document per key in a directory """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key: str) -> Optional[Any]:
+        """ Last snapshot stored for key, None if there isn't one """
+        try:
+            with open(self._path(key)) as snapshot_file:
+                data = json.load(snapshot_file)
+            metrics.increment("cache.snapshot.hit")
+            return data
+        except FileNotFoundError:
+            metrics.increment("cache.snapshot.miss")
+            return None
+        except Exception as exp:
+            logging.warning("Ignoring broken snapshot %s: %s", key, str(exp))
+            return None
+
+    def put(self, key: str, data: Any) -> None:
+        """ Replace the snapshot for key. Readers never see a partial file """
+        tmp_path = self._path(key) + ".tmp"
+        try:
+            with open(tmp_path, "w") as snapshot_file:
+                json.dump(data, snapshot_file)
+            os.replace(tmp_path, self._path(key))
+        except Exception as exp:
+            logging.error("Couldn't save snapshot %s: %s", key, str(exp))
@@ -0,0 +1,243 @@
+""" Local mirror of the Crunchyroll catalog, kept in sqlite with a full-text
+index on series, so search, browsing and episode lists can be answered without
+the network
+
+    $ python catalog.py [--workers N]    # refresh the mirror
+"""
+import json
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Optional, Iterable
+
+import api.crunchyroll as crapi
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    series_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    marker TEXT,
+    synced_marker TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS collections (
+    collection_id TEXT PRIMARY KEY,
+    series_id TEXT NOT NULL,
+    name TEXT
+);
+CREATE TABLE IF NOT EXISTS episodes (
+    media_id TEXT PRIMARY KEY,
+    series_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS collections_series ON collections (series_id);
+CREATE INDEX IF NOT EXISTS episodes_series ON episodes (series_id, position);
+"""
+
+# Rows share the rowid of their series row, so they are updated and joined by
+# rowid rather than by scanning an unindexed column. The mirror is never
+# VACUUMed, which could renumber the series rowids
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS series_fts USING fts5(name, description);
+"""
+
+# Fields of a list_series entry which change when episodes are added
+MARKER_FIELDS = ("media_count", "updated")
+
+
+def series_marker(series: dict) -> str:
+    return "|".join(str(series.get(field, "")) for field in MARKER_FIELDS)
+
+
+class CatalogMirror:
+    """ sqlite backed catalog. Safe to share between threads
+    """
+
+    def __init__(self, db_path: str):
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.executescript(SCHEMA)
+            try:
+                self._migrate_fts()
+                self._db.executescript(FTS_SCHEMA)
+                self.fts = True
+            except sqlite3.OperationalError:
+                logging.warning("sqlite has no FTS5, catalog search falls back to LIKE")
+                self.fts = False
+
+    def _migrate_fts(self) -> None:
+        """ Rebuild an index from before it was keyed by rowid """
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(series_fts)")]
+        if "series_id" not in columns:
+            return
+        logging.info("Rebuilding the catalog search index")
+        self._db.execute("DROP TABLE series_fts")
+        self._db.executescript(FTS_SCHEMA)
+        self._db.executemany(
+            "INSERT INTO series_fts (rowid, name, description) VALUES (?, ?, ?)",
+            [(rowid, name, json.loads(data).get("description") or "")
+             for rowid, name, data in self._db.execute("SELECT rowid, name, data FROM series")],
+        )
+
+    def upsert_series(self, series_list: Iterable[dict]) -> None:
+        """ Store series from list_series. Episodes of series whose marker changed
+        become stale """
+        with self._lock, self._db:
+            for series in series_list:
+                self._db.execute(
+                    "INSERT INTO series (series_id, name, marker, data) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (series_id) DO UPDATE SET name = excluded.name, "
+                    "marker = excluded.marker, data = excluded.data",
+                    (series["series_id"], series["name"], series_marker(series), json.dumps(series)),
+                )
+                if self.fts:
+                    (rowid,) = self._db.execute(
+                        "SELECT rowid FROM series WHERE series_id = ?", (series["series_id"],)
+                    ).fetchone()
+                    self._db.execute("DELETE FROM series_fts WHERE rowid = ?", (rowid,))
+                    self._db.execute(
+                        "INSERT INTO series_fts (rowid, name, description) VALUES (?, ?, ?)",
+                        (rowid, series["name"], series.get("description") or ""),
+                    )
+
+    def stale_series(self) -> List[str]:
+        """ Series whose episodes weren't fetched since their marker changed """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT series_id FROM series WHERE synced_marker IS NULL OR synced_marker != marker"
+            ).fetchall()
+        return [series_id for (series_id,) in rows]
+
+    def store_episodes(self, series_id: str, media: List[dict],
+                       collections: Optional[List[dict]] = None, synced: bool = False) -> None:
+        """ Replace the episodes (and collections) of a series. media is in display
+        order. synced marks the series as up to date with its marker """
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM episodes WHERE series_id = ?", (series_id,))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO episodes (media_id, series_id, position, data) VALUES (?, ?, ?, ?)",
+                [(episode["media_id"], series_id, position, json.dumps(episode))
+                 for position, episode in enumerate(media)],
+            )
+            if collections is not None:
+                self._store_collections(series_id, collections)
+            if synced:
+                self._db.execute("UPDATE series SET synced_marker = marker WHERE series_id = ?", (series_id,))
+
+    def store_collections(self, series_id: str, collections: List[dict]) -> None:
+        with self._lock, self._db:
+            self._store_collections(series_id, collections)
+
+    def _store_collections(self, series_id: str, collections: List[dict]) -> None:
+        self._db.execute("DELETE FROM collections WHERE series_id = ?", (series_id,))
+        self._db.executemany(
+            "INSERT OR REPLACE INTO collections (collection_id, series_id, name) VALUES (?, ?, ?)",
+            [(collection["collection_id"], series_id, collection["name"]) for collection in collections],
+        )
+
+    def list_episodes(self, series_id: str) -> List[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM episodes WHERE series_id = ? ORDER BY position", (series_id,)
+            ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def list_collections(self, series_id: str) -> Dict[str, str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT collection_id, name FROM collections WHERE series_id = ?", (series_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def list_series(self, offset: int = 0, limit: int = 50) -> List[dict]:
+        """ Series in alphabetical order """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM series ORDER BY name COLLATE NOCASE LIMIT ? OFFSET ?", (limit, offset)
+            ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def search(self, term: str, limit: int = 50) -> List[dict]:
+        """ Series matching every word of term, best matches first """
+        words = term.split()
+        if not words:
+            return []
+        with self._lock:
+            if self.fts:
+                query = " ".join('"%s"*' % word.replace('"', '""') for word in words)
+                rows = self._db.execute(
+                    "SELECT series.data FROM series_fts JOIN series ON series.rowid = series_fts.rowid "
+                    "WHERE series_fts MATCH ? ORDER BY rank LIMIT ?", (query, limit)
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT data FROM series WHERE " + " AND ".join(["name LIKE ?"] * len(words)) +
+                    " ORDER BY name LIMIT ?", ["%" + word + "%" for word in words] + [limit]
+                ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+
+class CatalogCrawler:
+    """ Fills a CatalogMirror from the API. Series are listed page by page, then
+    the episodes of the stale ones are fetched by a bounded pool of workers
+    """
+
+    PAGE_SIZE = 100
+
+    def __init__(self, api, mirror: CatalogMirror, workers: int = 4):
+        self.api = api
+        self.mirror = mirror
+        self.workers = workers
+
+    def _list_all_series(self) -> List[dict]:
+        series_list: List[dict] = []
+        while True:
+            page = self.api.list_series(
+                crapi.MediaType.ANIME, crapi.Filters.ALPHA, limit=self.PAGE_SIZE, offset=len(series_list)
+            )
+            series_list.extend(page)
+            if len(page) < self.PAGE_SIZE:
+                return series_list
+
+    def _fetch_series(self, series_id: str):
+        media = self.api.list_media(series_id=series_id, sort=crapi.SortOption.DESC, limit=1000)
+        collections = self.api.list_collections(series_id=series_id, limit=50)
+        return media, collections
+
+    def refresh(self) -> int:
+        """ Bring the mirror up to date. Returns the number of series refetched """
+        series_list = self._list_all_series()
+        self.mirror.upsert_series(series_list)
+        stale = self.mirror.stale_series()
+        logging.info("%d series in catalog, %d changed", len(series_list), len(stale))
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self._fetch_series, series_id): series_id for series_id in stale}
+            for future in as_completed(futures):
+                series_id = futures[future]
+                try:
+                    media, collections = future.result()
+                except Exception as exp:
+                    logging.warning("Couldn't fetch series %s: %s", series_id, str(exp))
+                    continue
+                self.mirror.store_episodes(series_id, media, collections, synced=True)
+        return len(stale)
+
+
+if __name__ == '__main__':
+    import argparse
+    import constants
+    from config import USER, PASS
+
+    parser = argparse.ArgumentParser(description="Refresh the local catalog mirror")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    crawler = CatalogCrawler(
+        crapi.CrunchyrollAPI(username=USER, password=PASS),
+        CatalogMirror(constants.APP_CATALOG_DB),
+        workers=args.workers,
+    )
+    logging.info("Refreshed %d series", crawler.refresh())
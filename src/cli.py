@@ -0,0 +1,128 @@
+""" Command line interface for scripts and launchers. Runs without the curses UI
+
+    $ python cli.py queue [--json]
+    $ python cli.py resume
+    $ python cli.py play SERIES EPISODE [--collection NAME]
+"""
+import sys
+import json
+import logging
+import argparse
+
+import session
+
+
+def _resume_target(episodes, user_state):
+    """ Episode to continue with: the last one watched, or the one after it if it
+    was completed. episodes are newest first """
+    ids = [episode.get_id() for episode in episodes]
+    accessed = dict(zip(ids, user_state.get_many("get_last_accessed", ids)))
+    last = max(episodes, key=lambda episode: accessed[episode.get_id()])
+    if not accessed[last.get_id()]:
+        return episodes[-1]
+    if not user_state.get_completed_status(last.get_id()):
+        return last
+    idx = episodes.index(last)
+    for episode in reversed(episodes[:idx]):
+        if episode.get_collection() == last.get_collection():
+            return episode
+    return None
+
+
+def cmd_queue(args):
+    user_state = session.get_user_state()
+    queue = [anime["series"] for anime in session.get_api().get_queue("anime")]
+    session.get_snapshot_cache().put("queue", queue)
+    if args.json:
+        ids = ["CR-" + series["series_id"] for series in queue]
+        json.dump([
+            {
+                "series_id": series["series_id"],
+                "name": series["name"],
+                "last_accessed": last_accessed,
+                "new_episodes": new_episodes,
+            }
+            for series, last_accessed, new_episodes in zip(
+                queue, user_state.get_many("get_item_last_accessed", ids), user_state.get_many("has_new_episodes", ids)
+            )
+        ], sys.stdout, indent=2)
+        print()
+    else:
+        for series in queue:
+            print("%s\t%s" % (series["series_id"], series["name"]))
+    return 0
+
+
+def cmd_resume(args):
+    from media import CRAnime
+    user_state = session.get_user_state()
+    anime_id = user_state.get_most_recent_item()
+    if anime_id is None:
+        logging.error("Nothing watched yet")
+        return 1
+    episodes = CRAnime({"series_id": anime_id[len("CR-"):]}).get_episodes()
+    episode = _resume_target(episodes, user_state) if episodes else None
+    if episode is None:
+        logging.error("No episode left to watch in %s", anime_id)
+        return 1
+    logging.info("Playing episode %s: %s", episode.get_number(), episode.get_name())
+    episode.open()
+    return 0
+
+
+def _find_series(name):
+    if name.isdigit():
+        return {"series_id": name}
+    found = session.get_catalog_mirror().search(name, limit=1)
+    if found:
+        return found[0]
+    name = name.lower()
+    for anime in session.get_api().get_queue("anime"):
+        if name in anime["series"]["name"].lower():
+            return anime["series"]
+    return None
+
+
+def cmd_play(args):
+    from media import CRAnime
+    series = _find_series(args.series)
+    if series is None:
+        logging.error("Series %s not found", args.series)
+        return 1
+    anime = CRAnime(series)
+    episodes = [episode for episode in anime.get_episodes() if episode.get_number() == args.episode]
+    if args.collection:
+        collections = anime.get_collections()
+        episodes = [
+            episode for episode in episodes
+            if args.collection.lower() in collections.get(episode.get_collection(), "").lower()
+        ]
+    if not episodes:
+        logging.error("Episode %s not found", args.episode)
+        return 1
+    # newest collection first
+    episodes[0].open()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CR-unsuck without the UI")
+    commands = parser.add_subparsers(dest="command", required=True)
+    queue_parser = commands.add_parser("queue", help="list the queue")
+    queue_parser.add_argument("--json", action="store_true")
+    queue_parser.set_defaults(func=cmd_queue)
+    resume_parser = commands.add_parser("resume", help="continue the most recently watched series")
+    resume_parser.set_defaults(func=cmd_resume)
+    play_parser = commands.add_parser("play", help="play an episode of a series")
+    play_parser.add_argument("series", help="series id or name")
+    play_parser.add_argument("episode", help="episode number")
+    play_parser.add_argument("--collection", help="part of the collection (season/sub/dub) name")
+    play_parser.set_defaults(func=cmd_play)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s', stream=sys.stderr)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,34 @@ APP_NAME = 'CR-unsuck'
 APP_VERSION = '0.1'
 APP_DATA_DIR = os.path.join('/home/nimesh/.local/share', APP_NAME)
 APP_DATA_FILE = os.path.join(APP_DATA_DIR, 'data.json')
+APP_CACHE_DIR = os.path.join(APP_DATA_DIR, 'cache')
+APP_CATALOG_DB = os.path.join(APP_DATA_DIR, 'catalog.db')
+
+# "mpv-pool" keeps an idle mpv around and reuses it, "streamlink" starts streamlink + player per episode
+PLAYER_BACKEND = "mpv-pool"
+MPV_SOCKET = os.path.join(APP_DATA_DIR, 'mpv.sock')
+
+# Use the daemon (daemon.py) when it is running
+USE_DAEMON = True
+DAEMON_SOCKET = os.path.join(APP_DATA_DIR, 'daemon.sock')
+DAEMON_CACHE_TTL = 5 * 60  # seconds
+
+NEW_EPISODE_POLL_INTERVAL = 15 * 60  # seconds, 0 disables polling
+NEW_EPISODE_POLL_BUDGET = 10  # list_media calls per poll
+NEW_EPISODE_NOTIFY = True
+
+# Locales episodes are fetched in, first one preferred, e.g. ["enUS", "deDE"]. With
+# more than one, they are fetched at once and merged into a single list
+EPISODE_LOCALES = []
+
+# Queue edits sent to the API at once
+QUEUE_EDIT_CONCURRENCY = 8
+
+# Dump metrics as JSON to this path on exit
+METRICS_DUMP_FILE = os.environ.get('CR_UNSUCK_METRICS')
+
+# Record API traffic to this path, see replay.py
+TRACE_FILE = os.environ.get('CR_UNSUCK_TRACE')
 
 if not os.path.exists(APP_DATA_DIR):
     os.makedirs(APP_DATA_DIR)
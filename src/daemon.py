@@ -0,0 +1,255 @@
+""" Optional background daemon owning the logged in API session, a response
+cache and the user state. The UI and the CLI use it instead of logging in
+themselves when it is running
+
+    $ python daemon.py
+"""
+import os
+import json
+import time
+import signal
+import socket
+import logging
+import threading
+import functools
+import socketserver
+from enum import Enum
+from typing import Any, Dict, Optional, Tuple
+
+import constants
+from metrics import registry as metrics
+
+# Methods clients may call, per target
+API_METHODS = {
+    "list_series", "list_collections", "list_media", "list_search_candidates",
+    "get_queue", "search", "add_to_queue", "remove_from_queue",
+}
+STATE_METHODS = {
+    "record_history", "get_playhead", "get_completed_status", "get_last_accessed",
+    "get_item_last_accessed", "update_item_access", "get_series_marker", "record_series_latest",
+    "mark_series_seen", "has_new_episodes", "get_most_recent_item", "get_many", "save_state",
+}
+# State calls that change it, saved shortly after
+STATE_WRITES = {"record_history", "update_item_access", "record_series_latest", "mark_series_seen"}
+SAVE_DELAY = 2  # seconds
+# API calls whose results are cached, and what invalidates them
+CACHED_API_METHODS = {"list_series", "list_collections", "list_media", "list_search_candidates", "get_queue"}
+INVALIDATES = {"add_to_queue": "get_queue", "remove_from_queue": "get_queue"}
+
+
+class _Encoder(json.JSONEncoder):
+    def default(self, o):  # pylint: disable=method-hidden
+        if isinstance(o, Enum):
+            return {"__enum__": type(o).__name__, "value": o.value}
+        return super().default(o)
+
+
+def _decode_enums(obj: dict):
+    if "__enum__" in obj:
+        import api.crunchyroll as crapi
+        enum_type = getattr(crapi, obj["__enum__"], None)
+        # only enums, clients mustn't get to construct anything else
+        if not (isinstance(enum_type, type) and issubclass(enum_type, Enum)):
+            raise ValueError("Unknown enum %s" % obj["__enum__"])
+        return enum_type(obj["value"])
+    return obj
+
+
+class ResponseCache:
+    """ TTL cache of API responses, keyed by method and arguments. Expired
+    entries are dropped as new ones are put, at most once per ttl """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+        self._pruned = time.monotonic()
+
+    def get(self, method: str, args_key: str):
+        with self._lock:
+            entry = self._entries.get((method, args_key))
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            return True, entry[1]
+        return False, None
+
+    def put(self, method: str, args_key: str, value: Any) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._entries[(method, args_key)] = (now, value)
+            if now - self._pruned >= self.ttl:
+                self._pruned = now
+                for key in [key for key, entry in self._entries.items() if now - entry[0] >= self.ttl]:
+                    del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def invalidate(self, method: str) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == method]:
+                del self._entries[key]
+
+
+class Daemon:
+    """ Executes the calls of the clients """
+
+    def __init__(self, api, user_state, cache_ttl: float = constants.DAEMON_CACHE_TTL):
+        self.targets = {"api": (api, API_METHODS), "state": (user_state, STATE_METHODS)}
+        self.cache = ResponseCache(cache_ttl)
+        # state calls are serialized, so saving never sees it half updated
+        self._state_lock = threading.Lock()
+        self._save_timer: Optional[threading.Timer] = None
+
+    def _schedule_save(self) -> None:
+        """ Save the state SAVE_DELAY after the first write since the last save """
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(SAVE_DELAY, self.save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def save(self) -> None:
+        with self._state_lock:
+            self._save_timer = None
+            user_state = self.targets["state"][0]
+            if user_state is not None:
+                user_state.save_state()
+
+    def call(self, target: str, method: str, args: list, kwargs: dict) -> Any:
+        obj, allowed = self.targets[target]
+        if method not in allowed:
+            raise ValueError("%s.%s can't be called remotely" % (target, method))
+        if target == "state":
+            with self._state_lock:
+                result = getattr(obj, method)(*args, **kwargs)
+                if method in STATE_WRITES:
+                    self._schedule_save()
+            return result
+        if method not in CACHED_API_METHODS:
+            result = getattr(obj, method)(*args, **kwargs)
+            if method in INVALIDATES:
+                self.cache.invalidate(INVALIDATES[method])
+            return result
+        args_key = json.dumps([args, kwargs], cls=_Encoder, sort_keys=True)
+        hit, result = self.cache.get(method, args_key)
+        if not hit:
+            result = getattr(obj, method)(*args, **kwargs)
+            self.cache.put(method, args_key, result)
+        return result
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            request = {}
+            try:
+                request = json.loads(line, object_hook=_decode_enums)
+                response = {"result": self.server.daemon.call(
+                    request["target"], request["method"], request.get("args", []), request.get("kwargs", {})
+                )}
+            except Exception as exp:  # pylint: disable=broad-except
+                logging.warning("%s.%s failed: %s", request.get("target"), request.get("method"), str(exp))
+                response = {"error": "%s: %s" % (type(exp).__name__, str(exp))}
+            self.wfile.write(json.dumps(response, cls=_Encoder).encode() + b"\n")
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, daemon: Daemon):
+        super().__init__(path, _Handler)
+        self.daemon = daemon
+
+
+class DaemonError(Exception):
+    """ A remote call failed """
+
+
+class DaemonClient:
+    """ Connection to a running daemon. Each thread gets its own socket
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        if getattr(self._local, "conn", None) is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            self._local.conn = (sock, sock.makefile("rb"))
+        return self._local.conn
+
+    def call(self, target: str, method: str, *args, **kwargs) -> Any:
+        sock, reader = self._connection()
+        try:
+            sock.sendall(json.dumps(
+                {"target": target, "method": method, "args": args, "kwargs": kwargs}, cls=_Encoder
+            ).encode() + b"\n")
+            line = reader.readline()
+        except OSError:
+            self._local.conn = None
+            raise
+        if not line:
+            self._local.conn = None
+            raise DaemonError("Daemon closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise DaemonError(response["error"])
+        return response["result"]
+
+
+class RemoteProxy:
+    """ Stand-in for the object the daemon holds for target. API calls are
+    timed here, the daemon's own metrics aren't visible to its clients """
+
+    def __init__(self, client: DaemonClient, target: str):
+        self._client = client
+        self._target = target
+
+    def __getattr__(self, name: str):
+        call = functools.partial(self._client.call, self._target, name)
+        if self._target == "api":
+            return metrics.timed("api." + name)(call)
+        return call
+
+
+def connect(path: str = constants.DAEMON_SOCKET) -> Optional[DaemonClient]:
+    """ Client for the daemon listening on path, None if it isn't running """
+    if not os.path.exists(path):
+        return None
+    client = DaemonClient(path)
+    try:
+        client._connection()  # pylint: disable=protected-access
+    except OSError:
+        return None
+    return client
+
+
+def serve(path: str = constants.DAEMON_SOCKET) -> None:
+    import session
+    if os.path.exists(path):
+        if connect(path) is not None:
+            raise SystemExit("Daemon already running on %s" % path)
+        os.unlink(path)
+    daemon = Daemon(session.get_api(), session.get_user_state())
+    server = _Server(path, daemon)
+    os.chmod(path, 0o600)
+
+    def _terminate(signum, _frame):
+        raise SystemExit("Terminated by signal %d" % signum)
+
+    signal.signal(signal.SIGTERM, _terminate)
+    signal.signal(signal.SIGHUP, _terminate)
+    logging.info("Listening on %s", path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
+        daemon.save()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    serve()
@@ -1,9 +1,73 @@
 """ My kawaii curses framework
 """
 # pylint: disable=too-few-public-methods
+import os
+import sys
+import time
+import heapq
 import curses
+import logging
+import itertools
+import selectors
+import threading
+import bisect
+import unicodedata
+from functools import lru_cache
+from collections import deque
+from concurrent.futures import Future
 from enum import Enum
-from typing import Union
+from typing import Union, Callable, Optional, List, Sequence, NamedTuple, Hashable, Any
+
+from workers import WorkerPool
+
+
+@lru_cache(maxsize=4096)
+def _fold_char(char: str) -> str:
+    folded = unicodedata.normalize("NFKD", char)[:1].lower()
+    return folded if len(folded) == 1 else char
+
+
+def normalize_text(text: str) -> str:
+    """ Lowercase, accent stripped version of text used for matching. Has exactly
+    one character per character of text, so match offsets are valid in both
+    """
+    if text.isascii():
+        return text.lower()
+    return "".join(_fold_char(char) for char in text)
+
+
+@lru_cache(maxsize=65536)
+def display_width(text: str) -> int:
+    """ Number of terminal cells text takes. Wide (CJK) characters take two,
+    combining characters none
+    """
+    if text.isascii():
+        return len(text)
+    width = 0
+    for char in text:
+        if unicodedata.combining(char):
+            continue
+        width += 2 if unicodedata.east_asian_width(char) in ("W", "F") else 1
+    return width
+
+
+def truncate_to_width(text: str, width: int) -> str:
+    """ Longest prefix of text fitting in width cells """
+    if display_width(text) <= width:
+        return text
+    used = 0
+    for idx, char in enumerate(text):
+        used += display_width(char)
+        if used > width:
+            return text[:idx]
+    return text
+
+
+def use_backend(backend) -> None:
+    """ Draw with backend instead of the curses module, eg. headless.HeadlessCurses
+    """
+    global curses  # pylint: disable=global-statement
+    curses = backend
 
 
 class ValueType(Enum):
@@ -23,7 +87,7 @@ class Value:
 class BaseObject:
     """ Base object which can be redrawn
     """
-    def send_event(self, ev):
+    def send_event(self, ev, count=1):
         pass
 
     def redraw(self):
@@ -46,6 +110,150 @@ class InputHandler:
             self.app.stdscr.getkey()
 
 
+class Timer:
+    """ Handle to a callback scheduled on the EventLoop
+    """
+    def __init__(self, when: float, callback: Callable, args: tuple):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __lt__(self, other):
+        return self.when < other.when
+
+
+class EventLoop:
+    """ Selector based event loop. Multiplexes readable file descriptors (keyboard),
+    timers and callbacks posted from worker threads. Everything except the work
+    submitted through run_in_background runs on the thread calling run_forever,
+    so callbacks are free to touch curses.
+    """
+    def __init__(self, max_workers: int = 4):
+        self._selector = selectors.DefaultSelector()
+        self._ready = deque()
+        self._timers = []
+        self._idle_callbacks = []
+        self._running = False
+        self._thread_id = threading.get_ident()
+        self._executor = WorkerPool(max_workers, "worker")
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, self._drain_wakeup)
+
+    def _drain_wakeup(self):
+        try:
+            while os.read(self._wakeup_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _wakeup(self):
+        try:
+            os.write(self._wakeup_w, b"\0")
+        except BlockingIOError:
+            # pipe is full, the loop is going to wake up anyway
+            pass
+
+    def in_loop_thread(self) -> bool:
+        return threading.get_ident() == self._thread_id
+
+    def add_reader(self, fd, callback: Callable) -> None:
+        self._selector.register(fd, selectors.EVENT_READ, callback)
+
+    def remove_reader(self, fd) -> None:
+        self._selector.unregister(fd)
+
+    def add_idle_callback(self, callback: Callable) -> None:
+        """ callback is run after every loop iteration, once all the pending
+        events have been processed """
+        self._idle_callbacks.append(callback)
+
+    def call_soon(self, callback: Callable, *args) -> None:
+        self._ready.append((callback, args))
+
+    def call_soon_threadsafe(self, callback: Callable, *args) -> None:
+        """ Schedule callback on the loop thread. Safe to call from any thread
+        """
+        self._ready.append((callback, args))
+        self._wakeup()
+
+    def call_later(self, delay: float, callback: Callable, *args) -> Timer:
+        timer = Timer(time.monotonic() + delay, callback, args)
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def run_in_background(self, func: Callable, *args,
+                          on_done: Optional[Callable] = None,
+                          on_error: Optional[Callable] = None) -> Future:
+        """ Run func in a worker thread. on_done(result) or on_error(exception)
+        are dispatched back to the loop thread
+        """
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(
+            lambda fut: self.call_soon_threadsafe(self._deliver, fut, on_done, on_error)
+        )
+        return future
+
+    @staticmethod
+    def _deliver(future: Future, on_done, on_error):
+        if future.cancelled():
+            return
+        exp = future.exception()
+        if exp is not None:
+            if on_error:
+                on_error(exp)
+            else:
+                logging.error("Background task failed: %s", str(exp))
+        elif on_done:
+            on_done(future.result())
+
+    def run_once(self, timeout: Optional[float] = None) -> None:
+        """ Wait for at most timeout seconds for events and process them
+        """
+        if self._ready:
+            timeout = 0
+        elif self._timers:
+            delay = max(0, self._timers[0].when - time.monotonic())
+            timeout = delay if timeout is None else min(timeout, delay)
+
+        for key, _ in self._selector.select(timeout):
+            key.data()
+
+        now = time.monotonic()
+        while self._timers and self._timers[0].when <= now:
+            timer = heapq.heappop(self._timers)
+            if not timer.cancelled:
+                self._ready.append((timer.callback, timer.args))
+
+        # callbacks scheduled while processing run in the next iteration
+        for _ in range(len(self._ready)):
+            callback, args = self._ready.popleft()
+            callback(*args)
+
+        for callback in self._idle_callbacks:
+            callback()
+
+    def run_forever(self) -> None:
+        self._running = True
+        self._thread_id = threading.get_ident()
+        while self._running:
+            self.run_once()
+
+    def stop(self) -> None:
+        self._running = False
+        self._wakeup()
+
+    def shutdown(self) -> None:
+        """ Stop the loop and drop the background work that hasn't started """
+        self.stop()
+        self._executor.shutdown()
+
+
 class App:
     def __init__(self, stdscr, root):
         self.stdscr = stdscr
@@ -54,6 +262,10 @@ class App:
         self.log_widget = None
         self.control_object = None
         self.callbacks = {}
+        self._invalidated = {}
+        self._input_time = None
+        self.loop = EventLoop()
+        self.loop.add_idle_callback(self.render)
 
     def resize(self, *args, **kwargs):
         y, x = self.stdscr.getmaxyx()
@@ -80,13 +292,73 @@ class App:
             callback()
 
     def run(self):
+        self.stdscr.nodelay(True)
         self.root.redraw()
+        self.loop.add_reader(sys.stdin.fileno(), self._on_input)
+        self.loop.run_forever()
+
+    def _on_input(self):
+        keys = []
         while True:
-            ch = self.stdscr.getkey()
+            try:
+                keys.append(self.stdscr.getkey())
+            except curses.error:
+                break
+        self.process_keys(keys)
+
+    def process_keys(self, keys):
+        """ Process a batch of keys. Runs of the same key are folded into a single
+        event with a repeat count, so held navigation keys move the cursor once
+        per batch. Invalidated widgets are drawn once, by render
+        """
+        if keys:
+            self._input_time = time.perf_counter()
+        for ch, run in itertools.groupby(keys):
             if ch == "KEY_RESIZE":
                 self.resize()
             elif self.control_object:
-                self.control_object.send_event(ch)
+                self.control_object.send_event(ch, sum(1 for _ in run))
+
+    def invalidate(self, obj):
+        """ Schedule obj to be redrawn on the next render """
+        self._invalidated[obj] = True
+
+    def render(self):
+        """ Redraw everything invalidated since the last frame """
+        if self._invalidated:
+            invalidated, self._invalidated = self._invalidated, {}
+            for obj in invalidated:
+                obj.redraw()
+            curses.doupdate()
+        # keys handled by drawing right away (or not at all) count too, so the
+        # time of one batch never leaks into the next
+        if self._input_time is not None:
+            # time from receiving keys to having drawn their effect
+            latency = time.perf_counter() - self._input_time
+            self._input_time = None
+            for callback in self.callbacks.get('on_key_frame', []):
+                callback(latency)
+
+    def run_in_background(self, func, *args, on_done=None, on_error=None, widget=None):
+        """ Run func off the UI thread. If widget is given, it shows a loading
+        indicator until the result is dispatched back
+        """
+        if widget is None:
+            return self.loop.run_in_background(func, *args, on_done=on_done, on_error=on_error)
+
+        def _finish(callback, value):
+            widget.stop_loading()
+            if callback:
+                callback(value)
+            elif isinstance(value, BaseException):
+                logging.error("Background task failed: %s", str(value))
+
+        widget.start_loading()
+        return self.loop.run_in_background(
+            func, *args,
+            on_done=lambda result: _finish(on_done, result),
+            on_error=lambda exp: _finish(on_error, exp),
+        )
 
     def register_callback(self, event, callback):
         if event not in self.callbacks:
@@ -106,6 +378,7 @@ class BaseLayout(BaseObject):
         self._y = None
         self.parent = parent
         self.event_processor = {}
+        self.repeat_processor = {}
         self.children = []
         self.app = None
         self.focused = True
@@ -118,9 +391,15 @@ class BaseLayout(BaseObject):
         should be propagated"""
         self.event_processor[event] = ev_processor
 
-    def unregister_event(self, event, ev_processor):
-        if event in self.event_processor:
-            del self.event_processor[event]
+    def register_repeatable_event(self, event, ev_processor):
+        """ Like register_event, but the processor is called once with the
+        number of times the event repeated in a row, as processor(self, count)
+        """
+        self.repeat_processor[event] = ev_processor
+
+    def unregister_event(self, event, ev_processor=None):
+        self.event_processor.pop(event, None)
+        self.repeat_processor.pop(event, None)
 
     def set_app(self, app):
         if self.parent:
@@ -132,14 +411,32 @@ class BaseLayout(BaseObject):
             self.app = self.parent.get_app()
         return self.app
 
-    def send_event(self, ev):
-        ret = False
-        if ev in self.event_processor:
-            ret = self.event_processor[ev](self)
-            if ret and self.parent:
-                self.parent.send_event(ev)
+    def send_event(self, ev, count=1):
+        if ev in self.repeat_processor:
+            if self.repeat_processor[ev](self, count) and self.parent:
+                self.parent.send_event(ev, count)
+        elif ev in self.event_processor:
+            for _ in range(count):
+                if self.event_processor[ev](self) and self.parent:
+                    self.parent.send_event(ev)
         elif self.parent:
-            self.parent.send_event(ev)
+            self.parent.send_event(ev, count)
+
+    def invalidate(self):
+        """ Redraw on the next frame instead of right away """
+        self.get_app().invalidate(self)
+
+    def shows(self, child):
+        """ Whether child is drawn when this is """
+        return True
+
+    def visible(self):
+        node = self
+        while node.parent is not None:
+            if not node.parent.shows(node):
+                return False
+            node = node.parent
+        return True
 
     def add_child(self, child):
         if self.children:
@@ -203,6 +500,29 @@ class StackedLayout(BaseLayout):
             raise Exception("StackedLayout can only have BaseLayouts as children")
 
 
+class SwitchLayout(StackedLayout):
+    """ Holds multiple children but only draws the current one
+    """
+    def __init__(self, width, height, parent):
+        super().__init__(width, height, parent)
+        self.current = 0
+
+    def show(self, idx):
+        self.current = idx
+        self.redraw()
+
+    def shows(self, child):
+        return self.children[self.current] is child
+
+    def redraw(self):
+        if self.parent == None:
+            self.compute_dimensions()
+        if self.children:
+            child = self.children[self.current]
+            child.compute_dimensions(self._height, self._width, self._x, self._y)
+            child.redraw()
+
+
 class HorizontalLayout(StackedLayout):
     """ child layouts arranged horizontally
     """
@@ -233,6 +553,8 @@ class Widget(BaseLayout):
     def __init__(self, parent, data=None):
         super().__init__(None, None, parent)
         self.data = data
+        # identifies the widget across BrowserWidget.patch_children calls
+        self.key = None
         if parent == None:
             raise Exception("Widget needs parents")
 
@@ -257,8 +579,8 @@ class Widget(BaseLayout):
     def get_display_text(self, text, width):
         """ Truncates if there is a chance of overflow. Don't use tabs, it breaks things
         """
-        if len(text) > width:
-            return text[:width] + '...'
+        if display_width(text) > width:
+            return truncate_to_width(text, width) + '...'
         return text
 
 
@@ -315,11 +637,78 @@ class ContainerWidget(Widget):
             child.redraw()
 
 
+class Table:
+    """ Column store for aligned rows, eg. the text of BrowserWidget items. Every
+    cell is measured once when it is set and column widths are maintained as rows
+    change, so rendering is a single pass and reordering or filtering rows never
+    measures anything again
+    """
+    def __init__(self, columns: int, padding: int = 3, min_widths: Optional[Sequence[int]] = None):
+        self.padding = padding
+        self.min_widths = list(min_widths) if min_widths else [0] * columns
+        self.cells: List[List[str]] = [[] for _ in range(columns)]
+        self.cell_widths: List[List[int]] = [[] for _ in range(columns)]
+        self.column_widths = list(self.min_widths)
+
+    def __len__(self):
+        return len(self.cells[0])
+
+    def append(self, row: Sequence[str]) -> bool:
+        """ Add a row. Returns True if column widths changed """
+        changed = False
+        for col, cell in enumerate(row):
+            width = display_width(cell)
+            self.cells[col].append(cell)
+            self.cell_widths[col].append(width)
+            if width > self.column_widths[col]:
+                self.column_widths[col] = width
+                changed = True
+        return changed
+
+    def set_row(self, idx: int, row: Sequence[str]) -> bool:
+        """ Replace a row. Returns True if column widths changed, in which case
+        every row renders differently """
+        changed = False
+        for col, cell in enumerate(row):
+            if self.cells[col][idx] == cell:
+                continue
+            old_width = self.cell_widths[col][idx]
+            width = display_width(cell)
+            self.cells[col][idx] = cell
+            self.cell_widths[col][idx] = width
+            if width > self.column_widths[col]:
+                self.column_widths[col] = width
+                changed = True
+            elif old_width == self.column_widths[col] and width < old_width:
+                self.column_widths[col] = max([self.min_widths[col]] + self.cell_widths[col])
+                changed = changed or self.column_widths[col] != old_width
+        return changed
+
+    def get_row(self, idx: int) -> tuple:
+        return tuple(cells[idx] for cells in self.cells)
+
+    def render_row(self, idx: int) -> str:
+        parts = []
+        last = len(self.cells) - 1
+        for col, cells in enumerate(self.cells):
+            parts.append(cells[idx])
+            if col != last:
+                parts.append(" " * (self.column_widths[col] + self.padding - self.cell_widths[col][idx]))
+        return "".join(parts)
+
+    def render(self, order: Optional[Sequence[int]] = None) -> List[str]:
+        """ Aligned text of the rows, in the given order (default insertion order) """
+        return [self.render_row(idx) for idx in (range(len(self)) if order is None else order)]
+
+
 class InactiveItemWidget(Widget):
     def __init__(self, parent, text, data=None):
         super().__init__(parent, data)
         self.text = text
 
+    def set_text(self, text):
+        self.text = text
+
     def redraw(self):
         window = curses.newwin(self._height, self._width, self._y, self._x)
         window.addstr(0, 0, self.get_display_text(self.text, self._width - 4).center(self._width - 1, '-'), curses.A_NORMAL if self.focused else curses.A_DIM)
@@ -330,23 +719,48 @@ class ItemWidget(Widget):
     def __init__(self, parent, text, data=None, default=False, style=curses.A_NORMAL):
         self.text = text
         self._selected = False
+        self._filter_key = None
+        self.highlight = None
         self.default = default
         self.style = style
+        self.marked = False
         super().__init__(parent, data)
 
+    def set_text(self, text):
+        self.text = text
+        self._filter_key = None
+
+    @property
+    def filter_key(self):
+        """ Normalized text, computed once """
+        if self._filter_key is None:
+            self._filter_key = normalize_text(self.text)
+        return self._filter_key
+
     def redraw(self):
         window = curses.newwin(self._height, self._width, self._y, self._x)
         attr = self.style
+        display_text = self.get_display_text(self.text, self._width - 4)
         if self._selected:
             attr |= curses.A_REVERSE
             if not self.focused:
                 attr |= curses.A_DIM
             window.bkgd(' ', attr)
-            window.addstr(0, 0, self.get_display_text(self.text, self._width - 4), attr)
+            window.addstr(0, 0, display_text, attr)
         else:
             if not self.focused:
                 attr |= curses.A_DIM
-            window.addstr(0, 0, self.get_display_text(self.text, self._width - 4), attr)
+            window.addstr(0, 0, display_text, attr)
+        if self.highlight:
+            start, length = self.highlight
+            if start < len(display_text):
+                # start counts characters, the column counts cells
+                window.addstr(
+                    0, display_width(display_text[:start]), display_text[start:start + length],
+                    attr | curses.A_BOLD | curses.A_UNDERLINE,
+                )
+        if self.marked and self._width > 3:
+            window.addstr(0, self._width - 2, "+", attr | curses.A_BOLD)
         window.refresh()
 
     def select(self):
@@ -356,27 +770,58 @@ class ItemWidget(Widget):
         self._selected = False
 
 
+class Row(NamedTuple):
+    """ Description of a BrowserWidget child, see BrowserWidget.patch_children
+    """
+    key: Hashable
+    text: str
+    data: Any = None
+    selectable: bool = True
+    style: int = curses.A_NORMAL
+    default: bool = False
+
+
 class BrowserWidget(Widget):
+    SPINNER_FRAMES = "|/-\\"
+    SPINNER_INTERVAL = 0.1
+
     def __init__(self, parent, data=None):
         super().__init__(parent, data)
         self.children = []
         self.pos = -1
         self.select_callback = None
-        self.register_event('j', lambda _: self.down())
-        self.register_event('k', lambda _: self.up())
-        self.register_event('KEY_DOWN', lambda _: self.down())
-        self.register_event('KEY_UP', lambda _: self.up())
+        # if set, called with the widget as the query changes instead of the
+        # children being filtered, eg. to search somewhere else
+        self.search_callback = None
+        self._loading = 0
+        self._spinner_frame = 0
+        self._spinner_timer = None
+        self.filtering = False
+        self.filter_query = ""
+        # (query, indices of matching children) for each refinement of the query
+        self._filter_stack = []
+        # indices of the children drawn by the last redraw
+        self._drawn = range(0)
+        self.register_repeatable_event('j', lambda _, count: self.move(count))
+        self.register_repeatable_event('k', lambda _, count: self.move(-count))
+        self.register_repeatable_event('KEY_DOWN', lambda _, count: self.move(count))
+        self.register_repeatable_event('KEY_UP', lambda _, count: self.move(-count))
         self.register_event('KEY_HOME', lambda _: self.first())
         self.register_event('KEY_END', lambda _: self.last())
+        self.register_event('/', lambda _: self.start_filter())
+        self.register_repeatable_event(' ', lambda _, count: self.toggle_mark(count))
+        self.register_event('*', lambda _: self.toggle_mark_all())
 
     def add_child(self, child):
         self.children.append(child)
         if isinstance(child, ItemWidget) and child.default and self.pos < 0:
             self.pos = len(self.children) - 1
+        self._filter_stack = []
 
     def remove_selected(self):
         if self.pos >= 0:
             self.children.remove(self.children[self.pos])
+            self._filter_stack = []
             for i in range(len(self.children)):
                 if isinstance(self.children[(self.pos + i) % len(self.children)], ItemWidget):
                     self.pos = (self.pos + i) % len(self.children)
@@ -387,25 +832,210 @@ class BrowserWidget(Widget):
     def clear_children(self):
         self.children = []
         self.pos = -1
+        self.filtering = False
+        self.filter_query = ""
+        self._filter_stack = []
+        self._drawn = range(0)
+
+    def patch_children(self, rows: Sequence[Row]) -> int:
+        """ Make the children match rows, reusing the children with the same keys.
+        The selected item is kept by key. If only the text of visible rows changed,
+        just those rows are redrawn. Returns the number of rows added or changed
+        """
+        old_keys = [child.key for child in self.children]
+        existing = {child.key: child for child in self.children}
+        selected = self.get_selected_item()
+        selected_key = selected.key if selected is not None else None
+        old_pos = self.pos
+        self.unselect_current()
+
+        children = []
+        changed = []
+        for row in rows:
+            cls = ItemWidget if row.selectable else InactiveItemWidget
+            child = existing.pop(row.key, None)
+            if child is None or type(child) is not cls:
+                if cls is ItemWidget:
+                    child = ItemWidget(self, row.text, row.data, default=row.default, style=row.style)
+                else:
+                    child = InactiveItemWidget(self, row.text, row.data)
+                child.key = row.key
+                changed.append(len(children))
+            else:
+                if child.text != row.text or (cls is ItemWidget and child.style != row.style):
+                    child.set_text(row.text)
+                    if cls is ItemWidget:
+                        child.style = row.style
+                    changed.append(len(children))
+                child.set_data(row.data)
+            children.append(child)
+        self.children = children
+        self._filter_stack = []
+
+        keys = [child.key for child in children]
+        if selected_key is not None and selected_key in existing:
+            # the selected item was removed, stay at the same place
+            self.pos = -1
+            for idx in range(min(old_pos, len(children) - 1), -1, -1):
+                if isinstance(children[idx], ItemWidget):
+                    self.pos = idx
+                    break
+        elif selected_key is not None:
+            self.pos = keys.index(selected_key)
+        else:
+            self.pos = next((idx for idx, row in enumerate(rows) if row.selectable and row.default), -1)
+
+        if self.pos >= 0:
+            children[self.pos].select()
+        if keys != old_keys or self.pos != old_pos or self.filter_query:
+            self.invalidate()
+        else:
+            for idx in changed:
+                if idx in self._drawn:
+                    children[idx].invalidate()
+        return len(changed)
+
+    def send_event(self, ev, count=1):
+        if self.filtering:
+            if ev == '\x1b':
+                self.clear_filter()
+                return
+            if ev == '\n':
+                self.filtering = False
+                self.invalidate()
+            elif ev in ('KEY_BACKSPACE', '\x7f', '\b'):
+                self.set_filter(self.filter_query[:-count])
+                return
+            elif len(ev) == 1 and ev.isprintable():
+                self.set_filter(self.filter_query + ev * count)
+                return
+        elif ev == '\x1b' and self.filter_query:
+            self.clear_filter()
+            return
+        super().send_event(ev, count)
+
+    def start_filter(self):
+        """ Typed characters narrow the list down until enter or escape """
+        self.filtering = True
+        self.invalidate()
+
+    def clear_filter(self):
+        self.filtering = False
+        self.set_filter("")
+
+    def set_filter(self, query):
+        """ Show only the items containing query. Results for every prefix of the
+        query are kept, so typing a character only rescans the previous matches
+        and backspace doesn't rescan at all
+        """
+        if self.search_callback is not None:
+            self.filter_query = query
+            self.search_callback(self)
+            self.invalidate()
+            return
+        while self._filter_stack and not query.startswith(self._filter_stack[-1][0]):
+            self._filter_stack.pop()
+        if query:
+            if self._filter_stack:
+                prefix_len = len(self._filter_stack[-1][0])
+            else:
+                prefix_len = len(query) - 1
+            for end in range(prefix_len + 1, len(query) + 1):
+                self._filter_stack.append((query[:end], self._refine(query[:end])))
+        self.filter_query = query
+
+        view = self._visible()
+        if self.pos not in view:
+            self.unselect_current()
+            self.pos = next((idx for idx in view if isinstance(self.children[idx], ItemWidget)), -1)
+        self.invalidate()
+
+    def _refine(self, query):
+        key = normalize_text(query)
+        if self._filter_stack:
+            candidates = self._filter_stack[-1][1]
+        else:
+            candidates = [idx for idx, child in enumerate(self.children) if isinstance(child, ItemWidget)]
+        children = self.children
+        return [idx for idx in candidates if key in children[idx].filter_key]
+
+    def _visible(self):
+        """ Indices of the children currently shown """
+        if not self.filter_query or self.search_callback is not None:
+            return range(len(self.children))
+        if not self._filter_stack:
+            # children changed since the last refinement
+            self.set_filter(self.filter_query)
+        return self._filter_stack[-1][1]
 
     def redraw(self):
+        if self._height is None:
+            return
         window = curses.newwin(self._height, self._width, self._y, self._x)
         window.refresh()
+        view = self._visible()
         if self.pos < 0:
-            for idx, child in enumerate(self.children):
-                if isinstance(child, ItemWidget):
+            for idx in view:
+                if isinstance(self.children[idx], ItemWidget):
                     self.pos = idx
                     break
 
         if self.pos >= 0:
             self.children[self.pos].select()
-        extra_padding = int(0.5 * self._height)
-        start = max(min(len(self.children) - self._height, self.pos - extra_padding), 0)
-        for idx, child in enumerate(self.children[start:start+self._height]):
+        height = self._height - 1 if self.filtering or self.filter_query else self._height
+        key = normalize_text(self.filter_query)
+        extra_padding = int(0.5 * height)
+        start = max(min(len(view) - height, bisect.bisect_left(view, self.pos) - extra_padding), 0)
+        self._drawn = view[start:start+height]
+        for idx, child_idx in enumerate(self._drawn):
+            child = self.children[child_idx]
+            if isinstance(child, ItemWidget):
+                at = child.filter_key.find(key) if key else -1
+                child.highlight = (at, len(key)) if at >= 0 else None
             child.compute_dimensions(1, self._width, self._x, idx + self._y)
             child.redraw()
+        if height < self._height:
+            self._draw_filter_prompt(len(view))
+        if self._loading:
+            self._draw_spinner()
         curses.doupdate()
 
+    def _draw_filter_prompt(self, matches):
+        window = curses.newwin(1, self._width, self._y + self._height - 1, self._x)
+        prompt = "/%s (%d)" % (self.filter_query, matches)
+        window.addnstr(0, 0, prompt, self._width - 1, curses.A_BOLD if self.filtering else curses.A_DIM)
+        window.refresh()
+
+    def _draw_spinner(self):
+        window = curses.newwin(1, self._width, self._y + self._height - 1, self._x)
+        frame = self.SPINNER_FRAMES[self._spinner_frame % len(self.SPINNER_FRAMES)]
+        window.addnstr(0, 0, "%s Loading..." % frame, self._width - 1, curses.A_BOLD)
+        window.refresh()
+
+    def _spin(self):
+        self._spinner_timer = None
+        if not self._loading:
+            return
+        self._spinner_frame += 1
+        if self._height:
+            self._draw_spinner()
+        self._spinner_timer = self.get_app().loop.call_later(self.SPINNER_INTERVAL, self._spin)
+
+    def start_loading(self):
+        """ Show a loading indicator until the matching stop_loading """
+        self._loading += 1
+        if self._spinner_timer is None:
+            self._spin()
+
+    def stop_loading(self):
+        self._loading = max(0, self._loading - 1)
+        if not self._loading:
+            if self._spinner_timer is not None:
+                self._spinner_timer.cancel()
+                self._spinner_timer = None
+            if self._height:
+                self.redraw()
+
     def unselect_current(self):
         if self.pos >= 0 and self.pos < len(self.children):
             self.children[self.pos].unselect()
@@ -420,50 +1050,155 @@ class BrowserWidget(Widget):
         self.pos = len(self.children)
         self.up()
 
-    def up(self):
-        next_pos = self.pos - 1
-        while next_pos >= 0 and not isinstance(self.children[next_pos], ItemWidget):
-            next_pos -= 1
-        if next_pos >= 0:
+    def move(self, steps):
+        """ Move the selection by steps items (negative moves up), stopping at
+        the ends. Only invalidates, so repeated moves cost a single redraw.
+        select_callback is also called when the cursor is held at an end
+        """
+        direction = 1 if steps > 0 else -1
+        view = self._visible()
+        at = bisect.bisect_left(view, self.pos)
+        if at == len(view) or view[at] != self.pos:
+            # current position is hidden, start from between its neighbours
+            at = at - 1 if direction > 0 else at
+        next_pos = self.pos
+        for _ in range(abs(steps)):
+            at += direction
+            while 0 <= at < len(view) and not isinstance(self.children[view[at]], ItemWidget):
+                at += direction
+            if not 0 <= at < len(view):
+                break
+            next_pos = view[at]
+        if next_pos != self.pos:
             self.unselect_current()
             self.pos = next_pos
-            self.redraw()
+            self.invalidate()
+        if self.select_callback:
+            self.select_callback(self)
+
+    def up(self):
+        self.move(-1)
 
     def down(self):
-        next_pos = self.pos + 1
-        while next_pos < len(self.children) and not isinstance(self.children[next_pos], ItemWidget):
-            next_pos += 1
-        if next_pos < len(self.children):
-            self.unselect_current()
-            self.pos = next_pos
-            self.redraw()
+        self.move(1)
 
     def get_selected_item(self):
         if self.pos >= 0:
             return self.children[self.pos]
         return None
 
+    def toggle_mark(self, count=1):
+        """ Mark (or unmark) the selected item and move to the next one """
+        for _ in range(count):
+            item = self.get_selected_item()
+            if item is None:
+                return
+            item.marked = not item.marked
+            self.move(1)
+        self.invalidate()
+
+    def toggle_mark_all(self):
+        """ Mark every shown item, or unmark them if they all are """
+        items = [self.children[idx] for idx in self._visible() if isinstance(self.children[idx], ItemWidget)]
+        mark = not all(item.marked for item in items)
+        for item in items:
+            item.marked = mark
+        self.invalidate()
+
+    def marked_items(self):
+        return [child for child in self.children if isinstance(child, ItemWidget) and child.marked]
+
+    def clear_marks(self):
+        marked = self.marked_items()
+        for item in marked:
+            item.marked = False
+        if marked:
+            self.invalidate()
+
 
 class LogWidget(Widget):
+    """ Shows the last lines logged. update can be called from any thread: lines go
+    into a ring buffer and the pane is repainted from the loop at most MAX_FPS times
+    a second, however fast they arrive
+    """
+    MAX_FPS = 10
+
     def __init__(self, parent, buffer_size=25, data=None):
         super().__init__(parent, data)
-        self.lines = []
+        self.lines = deque(maxlen=buffer_size)
         self.buffer_size = buffer_size
+        self.window = None
+        self._repaint_scheduled = False
+        self._last_repaint = 0.0
 
     def update(self, line):
         self.lines.append(line.strip())
-        if len(self.lines) > self.buffer_size:
-            self.lines = self.lines[-self.buffer_size:]
-        self.redraw()
+        self._schedule_repaint()
 
     def clear(self):
-        self.lines = []
+        self.lines.clear()
+        self._schedule_repaint()
+
+    def _schedule_repaint(self):
+        if self._repaint_scheduled:
+            return
+        self._repaint_scheduled = True
+        self.get_app().loop.call_soon_threadsafe(self._arm_repaint)
+
+    def _arm_repaint(self):
+        delay = self._last_repaint + 1 / self.MAX_FPS - time.monotonic()
+        self.get_app().loop.call_later(max(0.0, delay), self._repaint)
+
+    def _repaint(self):
+        # lines logged while drawing schedule the next frame
+        self._repaint_scheduled = False
+        if self.visible():
+            self.redraw()
+
+    def redraw(self):
+        if self._height is None:
+            return
+        self._last_repaint = time.monotonic()
+        if self.window is None or self.window.getbegyx() != (self._y, self._x) \
+                or self.window.getmaxyx() != (self._height, self._width):
+            self.window = curses.newwin(self._height, self._width, self._y, self._x)
+        else:
+            self.window.erase()
+        # list() snapshots the deque atomically, other threads may be appending
+        for idx, line in enumerate(list(self.lines)[-self._height:]):
+            self.window.addnstr(idx, 0, self.get_display_text(line, self._width - 4), self._width)
+        self.window.refresh()
+
+
+class TextWidget(Widget):
+    """ Shows the lines returned by a callable, refreshed every interval seconds
+    while refresh is active
+    """
+    def __init__(self, parent, lines_provider, interval=1.0, data=None):
+        super().__init__(parent, data)
+        self.lines_provider = lines_provider
+        self.interval = interval
+        self._timer = None
+
+    def start_refresh(self):
+        if self._timer is None:
+            self._refresh()
+
+    def stop_refresh(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _refresh(self):
         self.redraw()
+        self._timer = self.get_app().loop.call_later(self.interval, self._refresh)
 
     def redraw(self):
+        if self._height is None:
+            return
         window = curses.newwin(self._height, self._width, self._y, self._x)
-        for idx, line in enumerate(self.lines[-self._height:]):
-            window.addnstr(idx, 0, self.get_display_text(line, self._width - 4), self._width)
+        for idx, line in enumerate(self.lines_provider()[:self._height]):
+            window.addnstr(idx, 0, self.get_display_text(line, self._width - 4), self._width - 1)
         window.refresh()
 
 
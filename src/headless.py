@@ -0,0 +1,201 @@
+""" Headless curses backend. Implements the subset of curses used by gui.py on
+an in-memory screen, so layouts can run without a terminal, driven by scripted
+keys, while counting what every frame costs
+"""
+import time
+import curses as _curses
+from collections import deque
+from typing import List, Iterable
+
+
+class FrameStats:
+    """ Counters collected by the headless backend
+    """
+    def __init__(self):
+        self.windows_created = 0
+        self.cells_written = 0
+        self.refreshes = 0
+        self.frame_times: List[float] = []
+
+    def reset(self):
+        self.__init__()
+
+    def summary(self) -> dict:
+        frames = sorted(self.frame_times)
+        return {
+            "frames": len(frames),
+            "windows_created": self.windows_created,
+            "cells_written": self.cells_written,
+            "refreshes": self.refreshes,
+            "frame_ms_avg": 1000 * sum(frames) / len(frames) if frames else 0.0,
+            "frame_ms_p50": 1000 * frames[len(frames) // 2] if frames else 0.0,
+            "frame_ms_max": 1000 * frames[-1] if frames else 0.0,
+        }
+
+
+class FakeWindow:
+    """ In-memory curses window. Writes land in the window buffer and are copied
+    to the screen on refresh
+    """
+    def __init__(self, backend: "HeadlessCurses", nlines: int, ncols: int, begin_y: int, begin_x: int):
+        self.backend = backend
+        self.nlines = nlines
+        self.ncols = ncols
+        self.begin_y = begin_y
+        self.begin_x = begin_x
+        self.background = " "
+        self.cells = [[" "] * ncols for _ in range(nlines)]
+
+    def getmaxyx(self):
+        return self.nlines, self.ncols
+
+    def getbegyx(self):
+        return self.begin_y, self.begin_x
+
+    def _write(self, y: int, x: int, text: str) -> None:
+        if not (0 <= y < self.nlines and 0 <= x < self.ncols):
+            raise _curses.error("addwstr() returned ERR")
+        text = text[:self.ncols - x]
+        self.cells[y][x:x + len(text)] = text
+        self.backend.stats.cells_written += len(text)
+
+    def addstr(self, y: int, x: int, text: str, attr: int = 0) -> None:
+        self._write(y, x, text)
+
+    def addnstr(self, y: int, x: int, text: str, n: int, attr: int = 0) -> None:
+        self._write(y, x, text[:n])
+
+    def border(self, *args) -> None:
+        for y in range(self.nlines):
+            self._write(y, 0, "|")
+            self._write(y, self.ncols - 1, "|")
+        self._write(0, 0, "-" * self.ncols)
+        self._write(self.nlines - 1, 0, "-" * self.ncols)
+
+    def bkgd(self, char: str, attr: int = 0) -> None:
+        self.background = char
+
+    def erase(self) -> None:
+        self.cells = [[self.background] * self.ncols for _ in range(self.nlines)]
+
+    clear = erase
+
+    def refresh(self) -> None:
+        self.backend.stats.refreshes += 1
+        self.backend.stdscr.blit(self)
+
+    noutrefresh = refresh
+
+    def keypad(self, flag: bool) -> None:
+        pass
+
+    def nodelay(self, flag: bool) -> None:
+        pass
+
+
+class FakeScreen(FakeWindow):
+    """ stdscr: the visible screen plus a queue of scripted keys
+    """
+    def __init__(self, backend: "HeadlessCurses", lines: int, cols: int):
+        super().__init__(backend, lines, cols, 0, 0)
+        self.keys = deque()
+
+    def blit(self, window: FakeWindow) -> None:
+        for row, line in enumerate(window.cells):
+            y = window.begin_y + row
+            if 0 <= y < self.nlines:
+                self.cells[y][window.begin_x:window.begin_x + window.ncols] = line[:self.ncols - window.begin_x]
+
+    def feed(self, keys: Iterable[str]) -> None:
+        self.keys.extend(keys)
+
+    def getkey(self) -> str:
+        if not self.keys:
+            raise _curses.error("no input")
+        return self.keys.popleft()
+
+    def text(self) -> List[str]:
+        """ Screen content, one string per line """
+        return ["".join(line).rstrip() for line in self.cells]
+
+
+class HeadlessCurses:
+    """ Stand-in for the curses module, see gui.use_backend
+    """
+    error = _curses.error
+    A_NORMAL = _curses.A_NORMAL
+    A_BOLD = _curses.A_BOLD
+    A_DIM = _curses.A_DIM
+    A_REVERSE = _curses.A_REVERSE
+    A_UNDERLINE = _curses.A_UNDERLINE
+
+    def __init__(self, lines: int = 24, cols: int = 80):
+        self.LINES = lines  # pylint: disable=invalid-name
+        self.COLS = cols  # pylint: disable=invalid-name
+        self.stats = FrameStats()
+        self.stdscr = FakeScreen(self, lines, cols)
+
+    def newwin(self, nlines: int, ncols: int, begin_y: int, begin_x: int) -> FakeWindow:
+        self.stats.windows_created += 1
+        return FakeWindow(self, nlines, ncols, begin_y, begin_x)
+
+    def doupdate(self) -> None:
+        pass
+
+    def resizeterm(self, lines: int, cols: int) -> None:
+        self.LINES, self.COLS = lines, cols
+        self.stdscr = FakeScreen(self, lines, cols)
+
+    def initscr(self):
+        return self.stdscr
+
+    def curs_set(self, visibility: int) -> None:
+        pass
+
+    def start_color(self) -> None:
+        pass
+
+    def use_default_colors(self) -> None:
+        pass
+
+
+def press(app, keys: Iterable[str]) -> float:
+    """ Deliver keys to app as one input batch, run the loop until the frame is
+    drawn and return how long it took
+    """
+    backend = app.stdscr.backend
+    app.stdscr.feed(keys)
+    start = time.perf_counter()
+    app._on_input()  # pylint: disable=protected-access
+    app.loop.run_once(0)
+    elapsed = time.perf_counter() - start
+    backend.stats.frame_times.append(elapsed)
+    return elapsed
+
+
+def frame(app, func) -> float:
+    """ Run func (eg. filling a widget) and the loop until its effect is drawn,
+    as one frame. Returns how long it took """
+    backend = app.stdscr.backend
+    start = time.perf_counter()
+    func()
+    app.loop.run_once(0)
+    elapsed = time.perf_counter() - start
+    backend.stats.frame_times.append(elapsed)
+    return elapsed
+
+
+def run_for(app, seconds: float) -> None:
+    """ Run the app loop (timers, background results) for the given time. Every
+    loop iteration that drew something counts as a frame """
+    backend = app.stdscr.backend
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        refreshes = backend.stats.refreshes
+        start = time.perf_counter()
+        app.loop.run_once(0)
+        elapsed = time.perf_counter() - start
+        if backend.stats.refreshes != refreshes:
+            backend.stats.frame_times.append(elapsed)
+        else:
+            time.sleep(max(0.0, min(0.001, deadline - time.monotonic())))
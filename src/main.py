@@ -1,21 +1,32 @@
 """ Main app script
 """
+import os
 import sys
-import subprocess
+import time
+import atexit
+import threading
 import curses
 import logging
+from collections import OrderedDict
 from typing import List, Union, Optional
 
 import constants
+import session
 import api.crunchyroll as crapi
-from config import USER, PASS
-from gui import ItemWidget, BrowserWidget, ContainerWidget, LogWidget, InactiveItemWidget
-from gui import ShortcutWidget
-from gui import BaseLayout, HorizontalLayout, VerticalLayout, Value, App, ValueType
-from user_state import UserState
-
-api = crapi.CrunchyrollAPI(username=USER, password=PASS)
-user_state = UserState(constants.APP_DATA_FILE)
+from media import Anime, CRAnime, stop_playback
+from gui import ItemWidget, BrowserWidget, ContainerWidget, LogWidget
+from gui import ShortcutWidget, Table, Row, TextWidget
+from gui import BaseLayout, HorizontalLayout, VerticalLayout, SwitchLayout, Value, App, ValueType
+from poller import NewEpisodePoller
+from metrics import registry as metrics
+from profiler import SamplingProfiler
+from mutations import Mutation, MutationQueue
+from workers import WorkerPool
+
+api = session.get_api()
+user_state = session.get_user_state()
+snapshot_cache = session.get_snapshot_cache()
+prefetch_executor = WorkerPool(2, "prefetch")
 
 
 class GUIHandler(logging.StreamHandler):
@@ -28,143 +39,6 @@ class GUIHandler(logging.StreamHandler):
         self.handler(self.format(record))
 
 
-class Episode:
-    """ Base episode class
-    """
-
-    def get_id(self) -> str:
-        """ ID used in cache files
-        """
-
-    def open(self) -> None:
-        """ Opens the episode and sets the playhead
-        """
-
-    def get_number(self) -> str:
-        """ Get episode number
-        """
-
-    def get_name(self) -> str:
-        """ Get episode name
-        """
-
-    def get_collection(self) -> str:
-        """ Get collection (season/sub/dub) the episode belongs to
-        """
-
-
-class CREpisode(Episode):
-    """ Crunchyroll Episode class
-    """
-
-    def __init__(self, data: dict, anime_id: str = None):
-        self.data = data
-        self.anime_id = anime_id
-
-    def get_id(self):
-        return "CR-" + self.data["media_id"]
-
-    def open(self):
-        user_state.update_item_access(self.anime_id)
-        playhead = max(0, user_state.get_playhead(self.get_id()) - 5)
-        mpv_args = " ".join([
-            f"--start={playhead}",
-            "--term-status-msg \"Playback Status: ${{=time-pos}} ${{=duration}}\"",
-            "--cache=yes --cache-secs=300 --force-seekable=yes --hr-seek=yes",
-            "--hr-seek-framedrop=yes",
-            "{filename}"
-        ])
-        # mpv_args = (
-        #     "--start=%d " % playhead
-        # ) + '--term-status-msg "Playback Status: ${{=time-pos}} ${{=duration}} " {filename}'
-        args = [
-            "streamlink",
-            self.data["url"],
-            "best",
-            "--verbose-player",
-            "--player", "mpv",
-            "--player-args",
-            mpv_args
-        ]
-        player_process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
-        logging.info("$ " + " ".join(args))
-        playhead = None
-        for line in player_process.stdout:
-            try:
-                line = line.strip()
-                if "Playback Status:" in line:
-                    playhead, total_time = [float(x) for x in line.split()[-2:]]
-                    user_state.record_history(self.get_id(), playhead)
-            except Exception as exp:
-                logging.warning("Error parsing player stdout (%s): %s", line, str(exp))
-
-        if playhead:
-            user_state.record_history(self.get_id(), playhead, total_time)
-        else:
-            user_state.record_history(self.get_id(), 0)
-        player_process.wait()
-
-    def get_number(self):
-        return self.data["episode_number"]
-
-    def get_name(self):
-        return self.data["name"]
-
-    def get_collection(self):
-        return self.data.get("collection_id", None)
-
-
-class Anime:
-    """ Base Anime class
-    """
-
-    def get_id(self) -> str:
-        """ Get anime id
-        """
-
-    def get_collections(self) -> List[str]:
-        """ Get a list of collections
-        """
-
-    def get_episodes(self) -> List[Episode]:
-        """ Get list of episodes
-        """
-
-    def get_name(self) -> str:
-        """ Get name of anime
-        """
-
-
-class CRAnime(Anime):
-    """ Crunchyroll Anime
-    """
-
-    def __init__(self, data):
-        self.data = data
-
-    def get_id(self):
-        return "CR-" + self.data["series_id"]
-
-    def get_episodes(self):
-        logging.info("Fetching episodes...")
-        episodes = [
-            CREpisode(episode, anime_id=self.get_id())
-            for episode in api.list_media(series_id=self.data["series_id"], sort=crapi.SortOption.DESC, limit=1000)
-        ]
-        logging.info("Fetched %d episodes" % len(episodes))
-        return episodes
-
-    def get_collections(self):
-        logging.info("Fetching collections...")
-        collections = api.list_collections(series_id=self.data["series_id"], limit=50)
-        collections = {c["collection_id"]: c["name"] for c in collections}
-        logging.info("Fetched %d collections" % len(collections))
-        return collections
-
-    def get_name(self):
-        return self.data["name"]
-
-
 class Directory:
     """ Directory base class
     """
@@ -184,7 +58,12 @@ class Directory:
     def get_content(self) -> List[Union["Directory", Anime]]:
         """ Get content of directory
         """
-        return self.children
+        return ([self.parent] if self.parent else []) + self.children
+
+    def get_cached_content(self) -> Optional[List[Union["Directory", Anime]]]:
+        """ Get the last known content without hitting the network, None if unknown
+        """
+        return None
 
     def get_parent(self) -> Optional["Directory"]:
         """ Get directory parent
@@ -212,14 +91,43 @@ class CRQueueDirectory(Directory):
     """ Directory showing the Crunchyroll queue
     """
 
+    SNAPSHOT_KEY = "queue"
+
+    def _build_content(self, series_list):
+        anime_list = [CRAnime(series) for series in series_list]
+        last_accessed = user_state.get_many("get_item_last_accessed", [anime.get_id() for anime in anime_list])
+        order = sorted(range(len(anime_list)), key=lambda idx: (-last_accessed[idx], anime_list[idx].get_name()))
+        return [self.parent] + [anime_list[idx] for idx in order]
+
     def get_content(self):
-        return [self.parent] + sorted(
-            [CRAnime(anime["series"]) for anime in api.get_queue("anime")],
-            key=lambda x: (-user_state.get_item_last_accessed(x.get_id()), x.get_name()),
-        )
+        series_list = [anime["series"] for anime in api.get_queue("anime")]
+        snapshot_cache.put(self.SNAPSHOT_KEY, series_list)
+        return self._build_content(series_list)
+
+    def get_cached_content(self):
+        series_list = snapshot_cache.get(self.SNAPSHOT_KEY)
+        if series_list is None:
+            return None
+        return self._build_content(series_list)
 
     def delete_entry(self, item: CRAnime):
-        return api.remove_from_queue(item.data["series_id"])
+        return api.remove_from_queue(item.series_id)
+
+    def add_entry(self, item: CRAnime):
+        return api.add_to_queue(item.series_id)
+
+    def edit_snapshot(self, remove=(), add=()) -> List[dict]:
+        """ Apply queue edits to the snapshot ahead of the API, so the queue can be
+        redrawn right away. Returns the series removed """
+        series_list = snapshot_cache.get(self.SNAPSHOT_KEY)
+        if series_list is None:
+            return []
+        removed = [series for series in series_list if series["series_id"] in remove]
+        known = {series["series_id"] for series in series_list}
+        series_list = [series for series in series_list if series["series_id"] not in remove]
+        series_list.extend(series for series in add if series["series_id"] not in known)
+        snapshot_cache.put(self.SNAPSHOT_KEY, series_list)
+        return removed
 
     def get_shortcuts(self):
         return [
@@ -239,6 +147,160 @@ class CRQueueDirectory(Directory):
         pass
 
 
+class PageMarker:
+    """ Placeholder shown where a paged directory has more content
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def get_name(self) -> str:
+        return self.text
+
+
+class PagedDirectory(Directory):
+    """ Directory fetched a page at a time. Pages are loaded as the cursor gets
+    close to either end of the loaded ones, the next page is prefetched and at
+    most MAX_PAGES are kept
+    """
+
+    PAGE_SIZE = 50
+    MAX_PAGES = 4
+
+    def __init__(self, name: str, parent: Optional[Directory] = None):
+        super().__init__(name, parent)
+        self._pages = OrderedDict()  # page number -> list of Anime, in page order
+        self._last_page = None  # known once a short page was fetched
+        self._prefetched = {}  # page number -> Future
+        self._lock = threading.Lock()
+
+    def fetch_page(self, page: int) -> List[Anime]:
+        """ Fetch a page from the network
+        """
+
+    def _get_page(self, page: int) -> List[Anime]:
+        with self._lock:
+            future = self._prefetched.pop(page, None)
+        metrics.increment("prefetch.hit" if future is not None else "prefetch.miss")
+        entries = future.result() if future is not None else self.fetch_page(page)
+        if len(entries) < self.PAGE_SIZE:
+            self._last_page = page
+        return entries
+
+    def _prefetch(self, page: int) -> None:
+        if page < 0 or (self._last_page is not None and page > self._last_page):
+            return
+        with self._lock:
+            if page not in self._prefetched and page not in self._pages:
+                self._prefetched[page] = prefetch_executor.submit(self.fetch_page, page)
+
+    def has_next(self) -> bool:
+        return bool(self._pages) and (self._last_page is None or next(reversed(self._pages)) < self._last_page)
+
+    def has_previous(self) -> bool:
+        return bool(self._pages) and next(iter(self._pages)) > 0
+
+    def _content(self) -> List:
+        content = [self.parent] if self.parent else []
+        if self.has_previous():
+            content.append(PageMarker("... (previous)"))
+        for entries in self._pages.values():
+            content.extend(entries)
+        if self.has_next():
+            content.append(PageMarker("... (more)"))
+        return content
+
+    def get_content(self):
+        self._pages.clear()
+        self._last_page = None
+        with self._lock:
+            self._prefetched.clear()
+        self._pages[0] = self._get_page(0)
+        self._prefetch(1)
+        return self._content()
+
+    def load_next(self) -> List:
+        """ Load the page after the loaded ones, dropping the first if needed
+        """
+        page = next(reversed(self._pages)) + 1
+        self._pages[page] = self._get_page(page)
+        if len(self._pages) > self.MAX_PAGES:
+            self._pages.popitem(last=False)
+        self._prefetch(page + 1)
+        return self._content()
+
+    def load_previous(self) -> List:
+        """ Load the page before the loaded ones, dropping the last if needed
+        """
+        page = next(iter(self._pages)) - 1
+        self._pages[page] = self._get_page(page)
+        self._pages.move_to_end(page, last=False)
+        if len(self._pages) > self.MAX_PAGES:
+            self._pages.popitem(last=True)
+        self._prefetch(page - 1)
+        return self._content()
+
+
+class CRCatalogDirectory(PagedDirectory):
+    """ Directory browsing the Crunchyroll catalog with a list_series filter
+    """
+
+    def __init__(self, name: str, parent: Optional[Directory], search_filter: crapi.Filters,
+                 filter_param: Optional[str] = None):
+        super().__init__(name, parent)
+        self.search_filter = search_filter
+        self.filter_param = filter_param
+
+    def fetch_page(self, page):
+        series_list = api.list_series(
+            crapi.MediaType.ANIME,
+            self.search_filter,
+            self.filter_param,
+            limit=self.PAGE_SIZE,
+            offset=page * self.PAGE_SIZE,
+        )
+        return [CRAnime(series) for series in series_list]
+
+
+class CRAlphabeticalDirectory(CRCatalogDirectory):
+    """ Alphabetical catalog, read from the local catalog mirror once it was
+    filled (python catalog.py) and from the network until then
+    """
+
+    def __init__(self, name: str, parent: Optional[Directory]):
+        super().__init__(name, parent, crapi.Filters.ALPHA)
+        self._local = False
+
+    def get_content(self):
+        self._local = bool(session.get_catalog_mirror().list_series(limit=1))
+        return super().get_content()
+
+    def fetch_page(self, page):
+        if not self._local:
+            return super().fetch_page(page)
+        series_list = session.get_catalog_mirror().list_series(offset=page * self.PAGE_SIZE, limit=self.PAGE_SIZE)
+        return [CRAnime(series) for series in series_list]
+
+
+class CRSearchDirectory(Directory):
+    """ Series of the local catalog mirror matching query, best matches first.
+    The query is typed in the filter prompt of the list, the way back is only
+    shown while it is empty
+    """
+
+    def __init__(self, name: str, parent: Optional[Directory] = None):
+        super().__init__(name, parent)
+        self.query = ""
+
+    def get_content(self):
+        mirror = session.get_catalog_mirror()
+        if not self.query:
+            if not mirror.list_series(limit=1):
+                logging.info("The catalog mirror is empty, python catalog.py fills it")
+            return [self.parent] if self.parent else []
+        return [CRAnime(series) for series in mirror.search(self.query)]
+
+
 def generate_control_switch(lst, active=0):
     cur_control_idx = active
     lst_dict = {}
@@ -281,6 +343,18 @@ def generate_control_switch(lst, active=0):
 class MyApp(App):
     def __init__(self, stdscr):
         super().__init__(stdscr, BaseLayout(Value(curses.COLS), Value(curses.LINES), None))
+        self._pending_anime = None
+        self._pending_directory = None
+        self._page_loading = False
+        self.profiler = SamplingProfiler()
+        self.episodes = []
+        self.collections = {}
+        self.episode_table = None
+        self.episode_texts = []
+        self.episode_completed = {}
+        self.episode_accessed = {}
+        # locale the episode titles are shown and played in
+        self.locale = constants.EPISODE_LOCALES[0] if constants.EPISODE_LOCALES else None
         self._setup_logging()
         self._setup_layout()
 
@@ -310,9 +384,12 @@ class MyApp(App):
         l1 = HorizontalLayout(Value(1, ValueType.VAL_RELATIVE), Value(0.8, ValueType.VAL_RELATIVE), l4)
         l2 = BaseLayout(Value(0.3, ValueType.VAL_RELATIVE), Value(1, ValueType.VAL_RELATIVE), l1)
 
-        l5 = BaseLayout(Value(1, ValueType.VAL_RELATIVE), Value(-1, ValueType.VAL_ABSOLUTE), l4)
+        l5 = SwitchLayout(Value(1, ValueType.VAL_RELATIVE), Value(-1, ValueType.VAL_ABSOLUTE), l4)
         c3 = ContainerWidget(l5, True, "Log")
         self.set_log_widget(LogWidget(c3))
+        c4 = ContainerWidget(l5, True, "Stats")
+        self.stats_widget = TextWidget(c4, metrics.format_lines)
+        self.bottom_pane = l5
 
         c1 = ContainerWidget(l2, True, "Anime")
         c2 = ContainerWidget(l1, True, "Episodes")
@@ -326,13 +403,16 @@ class MyApp(App):
         self.anime_view_shortcuts = [
             ("s", "sort", sys.exit),
             ("d", "delete", self.delete_entry),
-            ("q", "exit", lambda _: sys.exit()),
+            ("a", "add to queue", self.add_entries),
+            ("q", "exit", lambda _: self.quit()),
         ]
         s1 = ShortcutWidget(l4, lst1, self.anime_view_shortcuts)
 
         self.init_directories()
         # Register events
-        self.root.register_event("q", lambda _: sys.exit())
+        self.root.register_event("q", lambda _: self.quit())
+        self.root.register_event("m", lambda _: self.toggle_stats())
+        self.root.register_event("p", lambda _: self.toggle_profiler())
         self.prev_switch, self.next_switch, self.switch_to = generate_control_switch(
             [("anime", lst1), ("episodes", lst2)], active=0
         )
@@ -341,35 +421,43 @@ class MyApp(App):
         l1.register_event("h", lambda _: self.prev_switch())
         l1.register_event("KEY_LEFT", lambda _: self.prev_switch())
         lst1.register_event("\n", self.list_content)
+        lst1.select_callback = self.on_directory_cursor
         lst2.register_event("\n", self.open_episode)
+        lst2.register_event("L", lambda _: self.next_locale())
         self.set_control(lst1)
+        self.register_callback("on_key_frame", lambda latency: metrics.observe("gui.key_frame", latency))
+        self.mutations = MutationQueue(self.loop, max_in_flight=constants.QUEUE_EDIT_CONCURRENCY)
+        self.new_episode_poller = NewEpisodePoller(api, user_state, budget=constants.NEW_EPISODE_POLL_BUDGET)
+        if constants.NEW_EPISODE_POLL_INTERVAL:
+            self.loop.call_later(5, self.poll_new_episodes)
+
+    PAGE_RETRY_DELAY = 2  # seconds before a page that failed to load is asked for again
+
+    CATALOG_GENRES = [
+        "action", "adventure", "comedy", "drama", "fantasy", "harem", "historical", "mecha",
+        "romance", "sci-fi", "seinen", "shojo", "shonen", "slice of life", "sports", "supernatural",
+    ]
 
     def init_directories(self):
         self.root_directory = Directory("")
-        CRQueueDirectory("CR Queue", self.root_directory)
+        self.queue_directory = CRQueueDirectory("CR Queue", self.root_directory)
+        catalog = Directory("CR Catalog", self.root_directory)
+        CRSearchDirectory("Search", catalog)
+        CRCatalogDirectory("Popular", catalog, crapi.Filters.POPULAR)
+        CRCatalogDirectory("Simulcasts", catalog, crapi.Filters.SIMULCAST)
+        CRCatalogDirectory("Recently updated", catalog, crapi.Filters.UPDATED)
+        CRCatalogDirectory("Newest", catalog, crapi.Filters.NEWEST)
+        CRAlphabeticalDirectory("Alphabetical", catalog)
+        genres = Directory("Genres", catalog)
+        for genre in self.CATALOG_GENRES:
+            CRCatalogDirectory(genre.title(), genres, crapi.Filters.TAG, genre)
+        letters = Directory("By letter", catalog)
+        for letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZ":
+            CRCatalogDirectory(letter, letters, crapi.Filters.PREFIX, letter)
         self.anime_list_widget.set_data(self.root_directory)
         for content in self.root_directory.get_content():
             ItemWidget(self.anime_list_widget, content.get_name(), content)
 
-    def tablize(self, rows, extra_padding):
-        ret = []
-        offset = []
-        prev_offset = 0
-        for col in range(len(rows[0])):
-            offset.append(0)
-            for row in rows:
-                ret.append("")
-                offset[-1] = max(offset[-1], prev_offset + len(row[col]) + extra_padding)
-            prev_offset = offset[-1]
-
-        for col in range(len(rows[0])):
-            for idx, row in enumerate(rows):
-                ret[idx] += row[col]
-                if col != len(rows[0]) - 1:
-                    ret[idx] += " " * (offset[col] - len(ret[idx]))
-
-        return ret
-
     def list_content(self, widget):
         item = widget.get_selected_item()
         if item:
@@ -377,59 +465,336 @@ class MyApp(App):
             if isinstance(item, Anime):
                 self.list_episodes(item)
             elif isinstance(item, Directory):
-                self.anime_list_widget.clear_children()
-                self.anime_list_widget.set_data(item)
-                logging.info("Loading queue")
-                for content in item.get_content():
-                    if content == item.parent:
-                        ItemWidget(self.anime_list_widget, "<- (Back)", content, style=curses.A_NORMAL)
-                    else:
-                        ItemWidget(self.anime_list_widget, content.get_name(), content)
-                self.anime_list_widget.redraw()
+                self.open_directory(item)
+
+    def open_directory(self, directory):
+        """ Show the last known content of directory right away, if any, and patch
+        in the fresh content once it arrives """
+        cached = directory.get_cached_content()
+        if cached is not None:
+            self.show_directory(directory, cached)
+
+        def _show_fresh(content):
+            # a later directory superseded this one, or the user moved on while
+            # the cached content was shown
+            if self._pending_directory is not directory:
+                return
+            if cached is None or self.anime_list_widget.get_data() is directory:
+                self.show_directory(directory, content)
+
+        self._pending_directory = directory
+        logging.info("Loading %s", directory.get_name() or "root")
+        self.run_in_background(directory.get_content, on_done=_show_fresh, widget=self.anime_list_widget)
+
+    def show_directory(self, directory, content):
+        widget = self.anime_list_widget
+        if widget.get_data() is not directory:
+            widget.clear_children()
+            widget.set_data(directory)
+            widget.search_callback = None
+            if isinstance(directory, CRSearchDirectory):
+                # typing searches the catalog, starting from the last query
+                widget.search_callback = self.search_catalog
+                widget.filter_query = directory.query
+                widget.start_filter()
+        anime_ids = [entry.get_id() for entry in content if isinstance(entry, Anime)]
+        with_new = {
+            anime_id for anime_id, has_new in zip(anime_ids, user_state.get_many("has_new_episodes", anime_ids))
+            if has_new
+        }
+        rows = []
+        for entry in content:
+            key = entry.get_id() if isinstance(entry, Anime) else id(entry)
+            if entry == directory.parent:
+                rows.append(Row(key, "<- (Back)", entry))
+            elif isinstance(entry, PageMarker):
+                rows.append(Row(entry.get_name(), entry.get_name(), selectable=False))
+            elif key in with_new:
+                rows.append(Row(key, "* " + entry.get_name(), entry, style=curses.A_BOLD))
+            else:
+                rows.append(Row(key, entry.get_name(), entry))
+        widget.patch_children(rows)
+
+    def search_catalog(self, widget):
+        """ Show the series of the catalog mirror matching the typed query """
+        directory = widget.get_data()
+        directory.query = widget.filter_query
+        self.show_directory(directory, directory.get_content())
+
+    def quit(self):
+        """ Stop playback, drop the queued background work and exit """
+        stop_playback()
+        self.loop.shutdown()
+        prefetch_executor.shutdown()
+        sys.exit()
+
+    def toggle_profiler(self):
+        """ Start sampling all threads, or stop and write the collapsed stacks """
+        if not self.profiler.running:
+            self.profiler.start()
+            logging.info("Profiler started, press p again to stop")
+            return
+        self.profiler.stop()
+        path = os.path.join(constants.APP_DATA_DIR, time.strftime("profile-%Y%m%d-%H%M%S.collapsed"))
+        self.profiler.write(path)
+
+    def toggle_stats(self):
+        """ Switch the bottom pane between the log and live metrics """
+        if self.bottom_pane.current == 0:
+            self.bottom_pane.show(1)
+            self.stats_widget.start_refresh()
+        else:
+            self.stats_widget.stop_refresh()
+            self.bottom_pane.show(0)
+
+    def refresh_queue_view(self):
+        """ Redraw the queue from its snapshot if it is shown """
+        directory = self.anime_list_widget.get_data()
+        if isinstance(directory, CRQueueDirectory):
+            content = directory.get_cached_content()
+            if content is not None:
+                self.show_directory(directory, content)
+
+    def poll_new_episodes(self):
+        """ Flag queued series with new episodes, then poll again after the interval """
+        def _poll():
+            queue = snapshot_cache.get(CRQueueDirectory.SNAPSHOT_KEY)
+            if queue is None:
+                queue = [anime["series"] for anime in api.get_queue("anime")]
+            names = {series["series_id"]: series["name"] for series in queue}
+            return [names[series_id] for series_id in self.new_episode_poller.poll(names)]
+
+        def _done(flagged):
+            if flagged:
+                logging.info("New episodes: %s", ", ".join(flagged))
+                if constants.NEW_EPISODE_NOTIFY:
+                    curses.beep()
+                self.refresh_queue_view()
+            self.loop.call_later(constants.NEW_EPISODE_POLL_INTERVAL, self.poll_new_episodes)
+
+        def _failed(exp):
+            logging.warning("Couldn't poll for new episodes: %s", str(exp))
+            self.loop.call_later(constants.NEW_EPISODE_POLL_INTERVAL, self.poll_new_episodes)
+
+        self.run_in_background(_poll, on_done=_done, on_error=_failed)
+
+    def on_directory_cursor(self, widget):
+        """ Load more of a paged directory when the cursor gets close to either
+        end. Checked again once a page arrived, as the cursor may still be there """
+        directory = widget.get_data()
+        if not isinstance(directory, PagedDirectory) or self._page_loading:
+            return
+        threshold = directory.PAGE_SIZE // 4
+        if widget.pos >= len(widget.children) - threshold and directory.has_next():
+            load = directory.load_next
+        elif widget.pos < threshold and directory.has_previous():
+            load = directory.load_previous
+        else:
+            return
 
-    def list_episodes(self, anime):
-        episodes = anime.get_episodes()
-        collections = anime.get_collections()
+        def _done(content):
+            self._page_loading = False
+            if widget.get_data() is directory:
+                self.show_directory(directory, content)
+                self.on_directory_cursor(widget)
+
+        def _failed(exp):
+            self._page_loading = False
+            logging.error("Couldn't load more of %s: %s", directory.get_name(), str(exp))
+            self.loop.call_later(
+                self.PAGE_RETRY_DELAY,
+                lambda: self.on_directory_cursor(widget) if widget.get_data() is directory else None,
+            )
+
+        self._page_loading = True
+        self.run_in_background(load, on_done=_done, on_error=_failed, widget=widget)
 
-        episode_item_text = []
-        latest_accessed_episode = None
-        latest_accessed_episode_time = 0
+    def list_episodes(self, anime):
+        def _fetch():
+            return anime.get_episodes(), anime.get_collections()
+
+        def _show(result):
+            # a later selection superseded this one
+            if self._pending_anime is anime:
+                episodes, collections = result
+                self.show_episodes(anime, episodes, collections)
+                if cached is None:
+                    self.switch_to("episodes")
+                if episodes:
+                    had_new = user_state.has_new_episodes(anime.get_id())
+                    user_state.mark_series_seen(anime.get_id(), episodes[0].get_id())
+                    if had_new:
+                        self.refresh_queue_view()
+
+        self._pending_anime = anime
+        cached = anime.get_cached_episodes()
+        if cached is not None:
+            self.show_episodes(anime, cached, anime.get_cached_collections())
+            self.switch_to("episodes")
+        self.run_in_background(_fetch, on_done=_show, widget=self.episode_list_widget)
+
+    def _load_episode_state(self):
+        """ Watched state of the shown episodes, fetched in two calls rather than
+        a few per episode """
+        ids = [episode.get_id() for episode in self.episodes]
+        self.episode_completed = dict(zip(ids, user_state.get_many("get_completed_status", ids)))
+        self.episode_accessed = dict(zip(ids, user_state.get_many("get_last_accessed", ids)))
+
+    def _episode_cells(self, episode):
+        completed = self.episode_completed.get(episode.get_id())
+        cells = (episode.get_number(), "\u2713" if completed else "", episode.variant(self.locale).get_name())
+        if len(constants.EPISODE_LOCALES) > 1:
+            cells += (" ".join(episode.get_available_locales()),)
+        return cells
+
+    def next_locale(self):
+        """ Show the episodes in the next configured locale. Every locale was
+        fetched with the episodes, so this doesn't wait on the network """
+        locales = constants.EPISODE_LOCALES
+        if len(locales) < 2:
+            return
+        self.locale = locales[(locales.index(self.locale) + 1) % len(locales)]
+        logging.info("Showing episodes in %s", self.locale)
+        if self.episodes:
+            self.refresh_episodes()
+
+    def show_episodes(self, anime, episodes, collections):
+        """ Show the episodes of anime. If anime is already shown, only the rows
+        that changed are updated and the cursor stays where it is """
+        widget = self.episode_list_widget
+        if widget.get_data() is None or widget.get_data().get_id() != anime.get_id():
+            widget.clear_children()
+        widget.set_data(anime)
+
+        # number, watched, title (and locales). The watched column always has room for the mark
+        if len(constants.EPISODE_LOCALES) > 1:
+            self.episode_table = Table(4, padding=3, min_widths=(0, 1, 0, 0))
+        else:
+            self.episode_table = Table(3, padding=3, min_widths=(0, 1, 0))
+        self.episodes = episodes
+        self.collections = collections
+        self._load_episode_state()
         for episode in episodes:
-            last_access_time = user_state.get_last_accessed(episode.get_id())
-            completed = user_state.get_completed_status(episode.get_id())
-            if last_access_time > latest_accessed_episode_time:
-                latest_accessed_episode, latest_accessed_episode_time = episode, last_access_time
-            episode_item_text.append((episode.get_number(), "\u2713" if completed else "", episode.get_name()))
-        episode_item_text = self.tablize(episode_item_text, 3)
-
-        self.episode_list_widget.clear_children()
+            self.episode_table.append(self._episode_cells(episode))
+        self.episode_texts = self.episode_table.render()
+        self._patch_episode_rows()
+
+    def refresh_episodes(self):
+        """ Re-read the watched state (and locale) of the shown episodes and patch
+        the rows that changed """
+        changed = []
+        widths_changed = False
+        self._load_episode_state()
+        for idx, episode in enumerate(self.episodes):
+            cells = self._episode_cells(episode)
+            if cells != self.episode_table.get_row(idx):
+                widths_changed |= self.episode_table.set_row(idx, cells)
+                changed.append(idx)
+        if not changed:
+            return
+        if widths_changed:
+            self.episode_texts = self.episode_table.render()
+        else:
+            for idx in changed:
+                self.episode_texts[idx] = self.episode_table.render_row(idx)
+        self._patch_episode_rows()
+
+    def _patch_episode_rows(self):
+        accessed = self.episode_accessed
+        latest_accessed_episode = max(self.episodes, key=lambda episode: accessed[episode.get_id()], default=None)
+        if latest_accessed_episode and not accessed[latest_accessed_episode.get_id()]:
+            latest_accessed_episode = None
+
+        rows = []
         current_collection = None
-        for episode_text, episode in zip(episode_item_text, episodes):
+        for episode_text, episode in zip(self.episode_texts, self.episodes):
             if episode.get_collection() != current_collection:
                 current_collection = episode.get_collection()
-                if current_collection in collections:
-                    InactiveItemWidget(self.episode_list_widget, collections[current_collection])
-            ItemWidget(self.episode_list_widget, episode_text, episode, default=(episode == latest_accessed_episode))
-
-        self.switch_to("episodes")
+                if current_collection in self.collections:
+                    rows.append(Row(
+                        ("collection", current_collection, episode.get_id()),
+                        self.collections[current_collection],
+                        selectable=False,
+                    ))
+            rows.append(Row(episode.get_id(), episode_text, episode, default=(episode is latest_accessed_episode)))
+        self.episode_list_widget.patch_children(rows)
 
     def open_episode(self, widget):
         item = widget.get_selected_item()
         if item:
             episode = item.get_data()
-            episode.open()
+
+            def _played(_):
+                # the list may have been refetched during playback, so compare ids
+                if any(shown.get_id() == episode.get_id() for shown in self.episodes):
+                    self.refresh_episodes()
+
+            self.run_in_background(episode.variant(self.locale).open, on_done=_played)
+
+    def _take_marked_anime(self, widget):
+        """ Series marked in widget (marks are cleared), or the selected one """
+        items = widget.marked_items() or [widget.get_selected_item()]
+        widget.clear_marks()
+        return [
+            item.get_data() for item in items
+            if item is not None and isinstance(item.get_data(), Anime)
+            and not self.mutations.in_flight(item.get_data().get_id())
+        ]
+
+    def _send_queue_edits(self, action, anime_list, call, undo):
+        """ Send one queue edit per series, concurrently. The queue snapshot was
+        already edited, failed edits are undone on it """
+        def _settled(done, failed):
+            if done:
+                logging.info("%s %d series", action, len(done))
+            if failed:
+                logging.error("%s failed for %d series", action, len(failed))
+            self.refresh_queue_view()
+
+        self.mutations.submit(
+            [Mutation(anime.get_id(), lambda anime=anime: call(anime), lambda anime=anime: undo(anime))
+             for anime in anime_list],
+            on_settled=_settled,
+        )
 
     def delete_entry(self, widget):
-        item = widget.get_selected_item()
-        if item:
-            entry_to_remove = item.get_data()
-            directory_to_remove_from = widget.get_data()
-            if directory_to_remove_from.delete_entry(entry_to_remove):
-                logging.info("Successfully removed from the queue")
-                widget.remove_selected()
-                widget.redraw()
-            else:
-                logging.error("Error removing the item")
+        """ Remove the marked (or selected) series from the queue """
+        if not isinstance(widget.get_data(), CRQueueDirectory):
+            return
+        anime_list = self._take_marked_anime(widget)
+        if not anime_list:
+            return
+        queue = self.queue_directory
+        removed = {series["series_id"]: series for series in queue.edit_snapshot(
+            remove={anime.series_id for anime in anime_list}
+        )}
+        self.refresh_queue_view()
+        self._send_queue_edits(
+            "Removed from the queue", anime_list, queue.delete_entry,
+            lambda anime: queue.edit_snapshot(add=[removed[anime.series_id]]) if anime.series_id in removed else None,
+        )
+
+    def add_entries(self, widget):
+        """ Add the marked (or selected) series to the queue """
+        anime_list = self._take_marked_anime(widget)
+        if not anime_list:
+            return
+        queue = self.queue_directory
+        queued = {series["series_id"] for series in snapshot_cache.get(queue.SNAPSHOT_KEY) or []}
+        anime_list = [anime for anime in anime_list if anime.series_id not in queued]
+        if not anime_list:
+            logging.info("Already in the queue")
+            return
+        queue.edit_snapshot(add=[{"series_id": anime.series_id, "name": anime.get_name()} for anime in anime_list])
+        self.refresh_queue_view()
+        self._send_queue_edits(
+            "Added to the queue", anime_list, queue.add_entry,
+            lambda anime: queue.edit_snapshot(remove={anime.series_id}),
+        )
+
+
+if constants.METRICS_DUMP_FILE:
+    atexit.register(metrics.dump, constants.METRICS_DUMP_FILE)
 
 
 def main(stdscr):
@@ -0,0 +1,289 @@
+""" Episodes and series
+"""
+import sys
+import logging
+import subprocess
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import session
+import constants
+import api.crunchyroll as crapi
+from metrics import registry as metrics
+from workers import WorkerPool
+
+_locale_pool = WorkerPool(4, "locale")
+# streamlink processes of the episodes playing
+_playing = set()
+
+
+class Episode:
+    """ Base episode class
+    """
+    __slots__ = ()
+
+    def get_id(self) -> str:
+        """ ID used in cache files
+        """
+
+    def open(self) -> None:
+        """ Opens the episode and sets the playhead
+        """
+
+    def get_number(self) -> str:
+        """ Get episode number
+        """
+
+    def get_name(self) -> str:
+        """ Get episode name
+        """
+
+    def get_collection(self) -> str:
+        """ Get collection (season/sub/dub) the episode belongs to
+        """
+
+    def variant(self, locale: Optional[str]) -> "Episode":
+        """ The episode as listed in locale, itself if it isn't known there
+        """
+        return self
+
+    def get_available_locales(self) -> List[str]:
+        """ Locales the episode can be watched in, empty if only one was fetched
+        """
+        return []
+
+
+class CREpisode(Episode):
+    """ Crunchyroll Episode, parsed once from a list_media entry. The raw
+    payload is only kept when asked for
+    """
+    __slots__ = ("id", "media_id", "anime_id", "url", "number", "name", "collection_id", "available",
+                 "locales", "raw")
+
+    def __init__(self, data: dict, anime_id: str = None, keep_raw: bool = False):
+        self.media_id = data["media_id"]
+        self.id = "CR-" + self.media_id
+        self.anime_id = anime_id
+        self.url = data["url"]
+        self.number = data["episode_number"]
+        self.name = data["name"]
+        self.collection_id = data.get("collection_id", None)
+        self.available = data.get("available", True)
+        # locale -> the episode as listed in that locale, for merged episodes
+        self.locales: Optional[Dict[str, "CREpisode"]] = None
+        self.raw = data if keep_raw else None
+
+    def get_id(self):
+        return self.id
+
+    def variant(self, locale):
+        if self.locales and locale in self.locales:
+            return self.locales[locale]
+        return self
+
+    def get_available_locales(self):
+        if not self.locales:
+            return []
+        return [locale for locale, episode in self.locales.items() if episode.available]
+
+    def open(self):
+        user_state = session.get_user_state()
+        user_state.update_item_access(self.anime_id)
+        playhead = max(0, user_state.get_playhead(self.get_id()) - 5)
+        if constants.PLAYER_BACKEND == "mpv-pool":
+            self._open_in_mpv_pool(playhead)
+        else:
+            self._open_with_streamlink(playhead)
+
+    def _open_in_mpv_pool(self, playhead):
+        import player
+        user_state = session.get_user_state()
+        url = player.resolve_stream_url(self.url)
+        logging.info("Playing %s in warm mpv", self.url)
+        playhead, total_time = player.get_player().play(
+            url, playhead, on_progress=lambda position: user_state.record_history(self.get_id(), position)
+        )
+        user_state.record_history(self.get_id(), playhead or 0, total_time if playhead else None)
+
+    def _open_with_streamlink(self, playhead):
+        user_state = session.get_user_state()
+        mpv_args = " ".join([
+            f"--start={playhead}",
+            "--term-status-msg \"Playback Status: ${{=time-pos}} ${{=duration}}\"",
+            "--cache=yes --cache-secs=300 --force-seekable=yes --hr-seek=yes",
+            "--hr-seek-framedrop=yes",
+            "{filename}"
+        ])
+        # mpv_args = (
+        #     "--start=%d " % playhead
+        # ) + '--term-status-msg "Playback Status: ${{=time-pos}} ${{=duration}} " {filename}'
+        args = [
+            "streamlink",
+            self.url,
+            "best",
+            "--verbose-player",
+            "--player", "mpv",
+            "--player-args",
+            mpv_args
+        ]
+        player_process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        _playing.add(player_process)
+        logging.info("$ " + " ".join(args))
+        playhead = None
+        for line in player_process.stdout:
+            try:
+                line = line.strip()
+                if "Playback Status:" in line:
+                    playhead, total_time = [float(x) for x in line.split()[-2:]]
+                    user_state.record_history(self.get_id(), playhead)
+            except Exception as exp:
+                logging.warning("Error parsing player stdout (%s): %s", line, str(exp))
+
+        if playhead:
+            user_state.record_history(self.get_id(), playhead, total_time)
+        else:
+            user_state.record_history(self.get_id(), 0)
+        player_process.wait()
+        _playing.discard(player_process)
+
+    def get_number(self):
+        return self.number
+
+    def get_name(self):
+        return self.name
+
+    def get_collection(self):
+        return self.collection_id
+
+
+def stop_playback() -> None:
+    """ Stop the episodes playing, so the threads waiting on them return """
+    for player_process in list(_playing):
+        player_process.terminate()
+    if "player" in sys.modules:
+        sys.modules["player"].shutdown()
+
+
+class Anime:
+    """ Base Anime class
+    """
+    __slots__ = ()
+
+    def get_id(self) -> str:
+        """ Get anime id
+        """
+
+    def get_collections(self) -> List[str]:
+        """ Get a list of collections
+        """
+
+    def get_episodes(self) -> List[Episode]:
+        """ Get list of episodes
+        """
+
+    def get_cached_episodes(self) -> Optional[List[Episode]]:
+        """ Get the last known list of episodes without hitting the network
+        """
+        return None
+
+    def get_cached_collections(self) -> Optional[dict]:
+        """ Get the last known collections without hitting the network
+        """
+        return None
+
+    def get_name(self) -> str:
+        """ Get name of anime
+        """
+
+
+def merge_locales(media_by_locale: Dict[str, List[dict]], anime_id: str) -> List[CREpisode]:
+    """ One episode per (collection, episode number) out of the listings of
+    several locales, given in order of preference. Episodes keep the order of
+    their collection's first listing, each remembers its variant per locale
+    """
+    collections: Dict[Optional[str], "OrderedDict[str, CREpisode]"] = OrderedDict()
+    for locale, media in media_by_locale.items():
+        for entry in media:
+            episode = CREpisode(entry, anime_id=anime_id)
+            merged = collections.setdefault(episode.collection_id, OrderedDict())
+            if episode.number not in merged:
+                episode.locales = {}
+                merged[episode.number] = episode
+            merged[episode.number].locales[locale] = episode
+    return [episode for merged in collections.values() for episode in merged.values()]
+
+
+class CRAnime(Anime):
+    """ Crunchyroll Anime, from a list_series or queue entry
+    """
+    __slots__ = ("id", "series_id", "name", "raw")
+
+    def __init__(self, data: dict, keep_raw: bool = False):
+        self.series_id = data["series_id"]
+        self.id = "CR-" + self.series_id
+        self.name = data.get("name", "")
+        self.raw = data if keep_raw else None
+
+    def get_id(self):
+        return self.id
+
+    def _list_media(self, locale=None):
+        return session.get_api().list_media(
+            series_id=self.series_id, sort=crapi.SortOption.DESC, limit=1000, locale=locale
+        )
+
+    def _locale_snapshot_key(self, locale):
+        return "episodes-%s-%s" % (self.series_id, locale)
+
+    def get_episodes(self):
+        locales = constants.EPISODE_LOCALES
+        if len(locales) > 1:
+            return self._get_episodes_in_locales(locales)
+        logging.info("Fetching episodes...")
+        media = self._list_media(locales[0] if locales else None)
+        session.get_catalog_mirror().store_episodes(self.series_id, media)
+        episodes = [CREpisode(episode, anime_id=self.get_id()) for episode in media]
+        logging.info("Fetched %d episodes" % len(episodes))
+        return episodes
+
+    def _get_episodes_in_locales(self, locales):
+        """ Fetch the episodes in every locale at once and merge them """
+        logging.info("Fetching episodes in %s...", ", ".join(locales))
+        media_by_locale = OrderedDict(zip(locales, _locale_pool.map(self._list_media, locales)))
+        session.get_catalog_mirror().store_episodes(self.series_id, media_by_locale[locales[0]])
+        snapshot_cache = session.get_snapshot_cache()
+        for locale, media in media_by_locale.items():
+            snapshot_cache.put(self._locale_snapshot_key(locale), media)
+        episodes = merge_locales(media_by_locale, self.get_id())
+        logging.info("Fetched %d episodes" % len(episodes))
+        return episodes
+
+    def get_cached_episodes(self):
+        locales = constants.EPISODE_LOCALES
+        if len(locales) > 1:
+            snapshot_cache = session.get_snapshot_cache()
+            media_by_locale = OrderedDict(
+                (locale, snapshot_cache.get(self._locale_snapshot_key(locale))) for locale in locales
+            )
+            if all(media is not None for media in media_by_locale.values()):
+                return merge_locales(media_by_locale, self.get_id())
+        media = session.get_catalog_mirror().list_episodes(self.series_id)
+        if not media:
+            metrics.increment("cache.catalog.miss")
+            return None
+        metrics.increment("cache.catalog.hit")
+        return [CREpisode(episode, anime_id=self.get_id()) for episode in media]
+
+    def get_collections(self):
+        logging.info("Fetching collections...")
+        collections = session.get_api().list_collections(series_id=self.series_id, limit=50)
+        session.get_catalog_mirror().store_collections(self.series_id, collections)
+        collections = {c["collection_id"]: c["name"] for c in collections}
+        logging.info("Fetched %d collections" % len(collections))
+        return collections
+
+    def get_cached_collections(self):
+        return session.get_catalog_mirror().list_collections(self.series_id)
+
+    def get_name(self):
+        return self.name
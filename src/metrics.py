@@ -0,0 +1,117 @@
+""" In-process metrics: latency histograms and counters
+"""
+import json
+import time
+import bisect
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+from typing import Dict, List
+
+
+class Histogram:
+    """ Latency histogram with fixed, roughly logarithmic buckets (in ms)
+    """
+
+    BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, millis: float) -> None:
+        self.counts[bisect.bisect_left(self.BUCKETS, millis)] += 1
+        self.count += 1
+        self.total += millis
+        self.max = max(self.max, millis)
+
+    def percentile(self, fraction: float) -> float:
+        """ Upper bound of the bucket holding the given fraction of observations """
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.BUCKETS[idx], self.max) if idx < len(self.BUCKETS) else self.max
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": self.total / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": self.max,
+        }
+
+
+class Registry:
+    """ Named histograms and counters. Safe to use from any thread
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(1000 * seconds)
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name: str):
+        """ Decorator recording the latency of every call """
+        def _decorator(func):
+            @functools.wraps(func)
+            def _wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return _wrapper
+        return _decorator
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "histograms": {name: hist.summary() for name, hist in sorted(self.histograms.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def format_lines(self) -> List[str]:
+        """ Human readable snapshot, one metric per line """
+        snapshot = self.snapshot()
+        lines = [
+            "%-28s n=%-6d avg=%7.1fms p50=%7.1fms p95=%7.1fms max=%7.1fms" % (
+                name, hist["count"], hist["avg_ms"], hist["p50_ms"], hist["p95_ms"], hist["max_ms"]
+            )
+            for name, hist in snapshot["histograms"].items()
+        ]
+        lines.extend("%-28s %d" % (name, value) for name, value in snapshot["counters"].items())
+        return lines
+
+    def dump(self, path: str) -> None:
+        try:
+            with open(path, "w") as dump_file:
+                json.dump(self.snapshot(), dump_file, indent=2)
+        except Exception as exp:
+            logging.error("Couldn't dump metrics: %s", str(exp))
+
+
+registry = Registry()
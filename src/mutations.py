@@ -0,0 +1,68 @@
+""" Edits (queue add/remove) sent to the API in the background, a bounded
+number at a time. The caller updates the UI before submitting, each edit that
+fails is undone
+"""
+import time
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable, Iterable, List, NamedTuple, Optional
+
+from metrics import registry as metrics
+from workers import WorkerPool
+
+
+class Mutation(NamedTuple):
+    """ One edit. call runs in a worker thread, undo on the loop thread if call
+    raised """
+    key: Hashable
+    call: Callable[[], Any]
+    undo: Optional[Callable[[], None]] = None
+
+
+class MutationQueue:
+    """ Runs batches of mutations concurrently, at most max_in_flight at once,
+    and reports every batch back on the loop thread once all of it is settled
+    """
+
+    def __init__(self, loop, max_in_flight: int = 8):
+        self.loop = loop
+        self._executor = WorkerPool(max_in_flight, "mutation")
+        # keys of the mutations not settled yet, only touched from the loop thread
+        self._in_flight = set()
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._in_flight
+
+    def submit(self, mutations: Iterable[Mutation],
+               on_settled: Optional[Callable[[List[Mutation], List[Mutation]], None]] = None) -> None:
+        """ Send mutations. on_settled(done, failed) is called once all of them
+        finished, after the failed ones were undone """
+        batch = list(mutations)
+        state = {"left": len(batch), "done": [], "failed": [], "start": time.perf_counter()}
+        if not batch and on_settled:
+            on_settled([], [])
+        for mutation in batch:
+            self._in_flight.add(mutation.key)
+            future = self._executor.submit(mutation.call)
+            future.add_done_callback(
+                lambda fut, mutation=mutation: self.loop.call_soon_threadsafe(
+                    self._settle, mutation, fut, state, on_settled
+                )
+            )
+
+    def _settle(self, mutation: Mutation, future: Future, state: dict, on_settled) -> None:
+        self._in_flight.discard(mutation.key)
+        exp = future.exception()
+        if exp is None:
+            state["done"].append(mutation)
+        else:
+            logging.warning("Edit %s failed: %s", mutation.key, str(exp))
+            metrics.increment("mutations.failed")
+            if mutation.undo:
+                mutation.undo()
+            state["failed"].append(mutation)
+        state["left"] -= 1
+        if not state["left"]:
+            metrics.observe("mutations.batch", time.perf_counter() - state["start"])
+            if on_settled:
+                on_settled(state["done"], state["failed"])
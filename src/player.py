@@ -0,0 +1,258 @@
+""" Warm player backend: one idle mpv process, controlled over its JSON IPC
+socket, plays episode after episode so only the first one pays for process
+startup and video output initialisation
+"""
+import os
+import json
+import fcntl
+import time
+import atexit
+import queue
+import socket
+import logging
+import threading
+import subprocess
+from typing import Callable, Optional, Tuple
+
+import constants
+
+MPV_ARGS = [
+    "--idle=yes",
+    "--force-window=yes",
+    "--cache=yes",
+    "--cache-secs=300",
+    "--force-seekable=yes",
+    "--hr-seek=yes",
+    "--hr-seek-framedrop=yes",
+]
+
+# mpv property observed for progress
+_TIME_POS, _DURATION = 1, 2
+
+
+class PlayerError(Exception):
+    """ mpv couldn't be started or died """
+
+
+class MpvPlayer:
+    """ Keeps an idle mpv running. play loads a URL into it and blocks until it
+    ends, is replaced by another play call or mpv exits. mpv is respawned the
+    next time it is needed if it died
+    """
+
+    STARTUP_TIMEOUT = 10
+
+    def __init__(self, socket_path: str = constants.MPV_SOCKET):
+        self.socket_path = socket_path
+        self._shared_path = socket_path
+        # held while this process is the one controlling the mpv on socket_path
+        self._lock_file = None
+        self._process: Optional[subprocess.Popen] = None
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+        self._request_id = 0
+        # events go to the queue of the current play call
+        self._events: Optional[queue.Queue] = None
+
+    def _alive(self) -> bool:
+        # an instance adopted from an earlier run has no process handle
+        return self._sock is not None and (self._process is None or self._process.poll() is None)
+
+    def _claim(self) -> None:
+        """ Lock the shared socket. If another live client (the UI, cli.py play)
+        holds it, use a socket of this process's own instead """
+        for path in (self._shared_path, "%s.%d" % (self._shared_path, os.getpid())):
+            lock_file = open(path + ".lock", "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                continue
+            self.socket_path = path
+            self._lock_file = lock_file
+            return
+        raise PlayerError("%s is in use" % self._shared_path)
+
+    def _adopt(self) -> bool:
+        """ Take over an mpv left listening on the socket by a run that crashed.
+        Only called with the socket claimed, so no live client is using it """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            return False
+        self._process = None
+        self._setup(sock)
+        logging.info("Reusing the mpv already running on %s", self.socket_path)
+        return True
+
+    def _spawn(self) -> None:
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+        if self._lock_file is None:
+            self._claim()
+        if os.path.exists(self.socket_path):
+            if self._sock is None and self._adopt():
+                return
+            os.unlink(self.socket_path)
+        self._process = subprocess.Popen(
+            ["mpv", "--input-ipc-server=" + self.socket_path] + MPV_ARGS,
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + self.STARTUP_TIMEOUT
+        while True:
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.socket_path)
+                break
+            except OSError:
+                sock.close()
+                if self._process.poll() is not None or time.monotonic() > deadline:
+                    self._process = None
+                    raise PlayerError("mpv didn't start")
+                time.sleep(0.05)
+        self._setup(sock)
+        logging.info("Started mpv (pid %d)", self._process.pid)
+
+    def _setup(self, sock: socket.socket) -> None:
+        self._sock = sock
+        threading.Thread(target=self._read_events, args=(sock,), name="mpv-events", daemon=True).start()
+        self._send("observe_property", _TIME_POS, "time-pos")
+        self._send("observe_property", _DURATION, "duration")
+        # closing the window shouldn't kill the warm instance
+        self._send("keybind", "q", "stop")
+
+    def shutdown(self) -> None:
+        """ Quit mpv. A play call waiting on it returns """
+        with self._lock:
+            sock, process = self._sock, self._process
+            self._sock = self._process = None
+        if sock is not None:
+            try:
+                sock.sendall(b'{"command": ["quit"]}\n')
+            except OSError:
+                pass
+        if process is not None:
+            try:
+                process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                process.terminate()
+        if sock is not None:
+            sock.close()
+        if self._lock_file is not None:
+            if self.socket_path != self._shared_path:
+                os.unlink(self._lock_file.name)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _send(self, *command) -> None:
+        self._request_id += 1
+        self._sock.sendall(json.dumps({"command": list(command), "request_id": self._request_id}).encode() + b"\n")
+
+    def _read_events(self, sock: socket.socket) -> None:
+        for line in sock.makefile("rb"):
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            events = self._events
+            if "event" in message and events is not None:
+                events.put(message)
+        # mpv exited or closed the socket
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+        events = self._events
+        if events is not None:
+            events.put({"event": "shutdown"})
+
+    def play(self, url: str, start: float = 0,
+             on_progress: Optional[Callable[[float], None]] = None) -> Tuple[Optional[float], Optional[float]]:
+        """ Play url from start seconds. Returns the last (playhead, duration) seen
+        """
+        events: queue.Queue = queue.Queue()
+        with self._lock:
+            if not self._alive():
+                self._spawn()
+            if self._events is not None:
+                self._events.put({"event": "replaced"})
+            self._events = events
+            try:
+                self._send("set_property", "start", "%.1f" % start)
+                self._send("loadfile", url, "replace")
+            except OSError:
+                # died between the check and now, recycle it once
+                self._spawn()
+                self._send("set_property", "start", "%.1f" % start)
+                self._send("loadfile", url, "replace")
+
+        playhead = duration = None
+        started = False
+        while True:
+            event = events.get()
+            name = event["event"]
+            if name in ("replaced", "shutdown"):
+                break
+            if name == "start-file":
+                started = True
+            elif not started:
+                # end of whatever played before
+                continue
+            elif name == "property-change" and event.get("data") is not None:
+                if event["id"] == _TIME_POS:
+                    playhead = event["data"]
+                    if on_progress:
+                        on_progress(playhead)
+                elif event["id"] == _DURATION:
+                    duration = event["data"]
+            elif name == "end-file":
+                if event.get("reason") == "error":
+                    logging.error("mpv couldn't play %s: %s", url, event.get("file_error", "unknown error"))
+                break
+        with self._lock:
+            if self._events is events:
+                self._events = None
+        return playhead, duration
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def resolve_stream_url(url: str) -> str:
+    """ Direct URL of the best stream of an episode page, resolved in-process
+    with streamlink. Falls back to the streamlink command """
+    global _resolver  # pylint: disable=global-statement
+    try:
+        with _resolver_lock:
+            if _resolver is None:
+                from streamlink.session import Streamlink
+                from config import USER, PASS
+                _resolver = Streamlink()
+                _resolver.set_plugin_option("crunchyroll", "username", USER)
+                _resolver.set_plugin_option("crunchyroll", "password", PASS)
+        return _resolver.streams(url)["best"].to_url()
+    except Exception as exp:
+        logging.warning("Resolving the stream in-process failed (%s), using streamlink", str(exp))
+        return subprocess.check_output(["streamlink", "--stream-url", url, "best"], universal_newlines=True).strip()
+
+
+_player = None
+_player_lock = threading.Lock()
+
+
+def get_player() -> MpvPlayer:
+    global _player  # pylint: disable=global-statement
+    with _player_lock:
+        if _player is None:
+            _player = MpvPlayer()
+            atexit.register(_player.shutdown)
+        return _player
+
+
+def shutdown() -> None:
+    """ Quit the warm mpv, if one was started """
+    with _player_lock:
+        if _player is not None:
+            _player.shutdown()
@@ -0,0 +1,52 @@
+""" Polls for new episodes of the series in the queue
+"""
+import logging
+from typing import Iterable, List
+
+import api.crunchyroll as crapi
+from catalog import series_marker
+from user_state import UserState
+
+
+class NewEpisodePoller:
+    """ Uses the recently updated and simulcast series lists as a cheap change
+    feed. Only queued series found in the feed whose marker changed get their
+    latest episode fetched, at most budget of them per poll
+    """
+
+    FEED_FILTERS = (crapi.Filters.UPDATED, crapi.Filters.SIMULCAST)
+
+    def __init__(self, api: crapi.CrunchyrollAPI, user_state: UserState, budget: int = 10, feed_size: int = 50):
+        self.api = api
+        self.user_state = user_state
+        self.budget = budget
+        self.feed_size = feed_size
+
+    def poll(self, queue: Iterable[str]) -> List[str]:
+        """ queue is the list of queued series ids. Returns the ids of the series
+        which got new episodes since the user last looked at them """
+        feed = {}
+        for search_filter in self.FEED_FILTERS:
+            for series in self.api.list_series(crapi.MediaType.ANIME, search_filter, limit=self.feed_size):
+                feed[series["series_id"]] = series
+
+        changed = [
+            series_id for series_id in queue
+            if series_id in feed
+            and series_marker(feed[series_id]) != self.user_state.get_series_marker("CR-" + series_id)
+        ]
+        if len(changed) > self.budget:
+            logging.info("%d series changed, checking %d this time", len(changed), self.budget)
+
+        flagged = []
+        # series over budget keep their old marker and are checked next time
+        for series_id in changed[:self.budget]:
+            media = self.api.list_media(series_id=series_id, sort=crapi.SortOption.DESC, limit=1)
+            anime_id = "CR-" + series_id
+            had_new = self.user_state.has_new_episodes(anime_id)
+            self.user_state.record_series_latest(
+                anime_id, series_marker(feed[series_id]), "CR-" + media[0]["media_id"] if media else None
+            )
+            if not had_new and self.user_state.has_new_episodes(anime_id):
+                flagged.append(series_id)
+        return flagged
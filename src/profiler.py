@@ -0,0 +1,65 @@
+""" Low overhead sampling profiler covering every thread. Writes collapsed
+stacks ("thread;outer;...;inner count" lines), as read by flamegraph.pl,
+speedscope and similar tools
+"""
+import os
+import sys
+import logging
+import threading
+from collections import Counter
+
+
+class SamplingProfiler:
+    """ Samples the stacks of all the other threads every interval seconds
+    from a background thread
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = Counter()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.samples = Counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        if self.running:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return self.samples
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        code_names = {}
+        while not self._stop.wait(self.interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    name = code_names.get(code)
+                    if name is None:
+                        name = code_names[code] = "%s:%s" % (os.path.basename(code.co_filename), code.co_name)
+                    stack.append(name)
+                    frame = frame.f_back
+                stack.append(thread_names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def write(self, path: str) -> None:
+        with open(path, "w") as profile_file:
+            for stack, count in self.samples.most_common():
+                profile_file.write("%s %d\n" % (stack, count))
+        logging.info("Wrote %d samples to %s", sum(self.samples.values()), path)
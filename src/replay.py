@@ -0,0 +1,228 @@
+""" Record CrunchyrollAPI traffic to a trace and replay it against a local
+stand-in, to load test the client stack
+
+Set CR_UNSUCK_TRACE=path when running the app (or the daemon) to record. Every
+API call the app makes and every response the backend gave is appended to
+the trace. Replaying runs copies of the recorded sessions in parallel, with
+the backend answering from the trace after the recorded latency
+
+    $ python replay.py TRACE [--sessions N] [--concurrency N] [--speed X]
+                             [--latency-scale X] [--daemon] [--json]
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import math
+import logging
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import daemon
+
+# search and its candidates don't go through the backend, so can't be replayed
+RECORDED_METHODS = daemon.API_METHODS - {"search", "list_search_candidates"}
+
+
+def _params_key(method: str, params) -> str:
+    return method + json.dumps(params, cls=daemon._Encoder, sort_keys=True)  # pylint: disable=protected-access
+
+
+class TraceRecorder:
+    """ Appends the calls made to a CrunchyrollAPI ("call" records) and the
+    backend responses behind them ("backend" records) to a JSON lines file
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self.session = "%d-%d" % (os.getpid(), int(time.time()))
+
+    def _write(self, record: dict) -> None:
+        record["session"] = self.session
+        line = json.dumps(record, cls=daemon._Encoder)  # pylint: disable=protected-access
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def install(self, api) -> None:
+        """ Start recording the traffic of api """
+        backend = api._api  # pylint: disable=protected-access
+        api_call = backend._api_call  # pylint: disable=protected-access
+
+        def _recorded_api_call(method, params, *args, **kwargs):
+            start = time.perf_counter()
+            record = {"kind": "backend", "method": method, "params": params}
+            try:
+                record["response"] = api_call(method, params, *args, **kwargs)
+                return record["response"]
+            except Exception as exp:
+                record["error"] = "%s: %s" % (type(exp).__name__, str(exp))
+                raise
+            finally:
+                record["latency"] = time.perf_counter() - start
+                self._write(record)
+
+        backend._api_call = _recorded_api_call  # pylint: disable=protected-access
+        for name in RECORDED_METHODS:
+            setattr(api, name, self._recorded_method(name, getattr(api, name)))
+
+    def _recorded_method(self, name, method):
+        def _recorded(*args, **kwargs):
+            self._write({
+                "kind": "call", "t": time.monotonic() - self._start, "method": name,
+                "args": list(args), "kwargs": kwargs,
+            })
+            return method(*args, **kwargs)
+        return _recorded
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """ Nearest-rank percentile of the sorted values, 0 if there are none """
+    if not values:
+        return 0.0
+    return values[max(math.ceil(fraction * len(values)), 1) - 1]
+
+
+def load_trace(path: str) -> List[dict]:
+    with open(path) as trace_file:
+        return [json.loads(line, object_hook=daemon._decode_enums)  # pylint: disable=protected-access
+                for line in trace_file if line.strip()]
+
+
+class StandInBackend:
+    """ Answers _api_call like the recorded backend did, after the recorded
+    latency times latency_scale. Repeated requests cycle through the responses
+    recorded for them
+    """
+
+    def __init__(self, records: List[dict], latency_scale: float = 1.0):
+        self.latency_scale = latency_scale
+        self._responses: Dict[str, List[dict]] = defaultdict(list)
+        self._next: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        for record in records:
+            if record["kind"] == "backend":
+                self._responses[_params_key(record["method"], record["params"])].append(record)
+
+    def _api_call(self, method, params, *args, **kwargs):  # pylint: disable=unused-argument
+        key = _params_key(method, params)
+        with self._lock:
+            recorded = self._responses.get(key)
+            if not recorded:
+                raise KeyError("%s %s isn't in the trace" % (method, params))
+            record = recorded[self._next[key] % len(recorded)]
+            self._next[key] += 1
+        time.sleep(record["latency"] * self.latency_scale)
+        if "error" in record:
+            raise RuntimeError(record["error"])
+        return record["response"]
+
+
+def replay(records: List[dict], sessions: int = 1, concurrency: int = 8, speed: float = 1.0,
+           latency_scale: float = 1.0, through_daemon: bool = False) -> dict:
+    """ Replay the calls of every recorded session, sessions times in parallel.
+    Calls start at their recorded time divided by speed (0: all at once), at
+    most concurrency at a time. Latency is measured from the time a call was
+    due, so it includes waiting for a free worker """
+    import api.crunchyroll as crapi
+    client = crapi.CrunchyrollAPI(backend=StandInBackend(records, latency_scale))
+    if through_daemon:
+        server = daemon.Daemon(client, None)
+        call = lambda method, args, kwargs: server.call("api", method, args, kwargs)
+    else:
+        call = lambda method, args, kwargs: getattr(client, method)(*args, **kwargs)
+
+    # (due, sequence, call record), every recorded session starting at 0
+    calls = [record for record in records if record["kind"] == "call"]
+    starts: Dict[str, float] = {}
+    for record in calls:
+        starts[record["session"]] = min(starts.get(record["session"], record["t"]), record["t"])
+    schedule = []
+    for _ in range(sessions):
+        for record in calls:
+            due = (record["t"] - starts[record["session"]]) / speed if speed else 0.0
+            schedule.append((due, len(schedule), record))
+    heapq.heapify(schedule)
+
+    # every call's latency in ms, a load test report wants exact percentiles
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    begin = time.monotonic()
+
+    def _run(due, record):
+        failed = False
+        try:
+            call(record["method"], record["args"], record["kwargs"])
+        except Exception as exp:  # pylint: disable=broad-except
+            logging.debug("%s failed: %s", record["method"], str(exp))
+            failed = True
+        latency = time.monotonic() - (begin + due)
+        with lock:
+            latencies[record["method"]].append(1000 * latency)
+            errors[record["method"]] += failed
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay") as pool:
+        while schedule:
+            due, _, record = heapq.heappop(schedule)
+            delay = begin + due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(_run, due, record)
+    elapsed = time.monotonic() - begin
+
+    for values in latencies.values():
+        values.sort()
+    total = sum(len(values) for values in latencies.values())
+    return {
+        "requests": total,
+        "seconds": elapsed,
+        "requests_per_second": total / elapsed if elapsed else 0.0,
+        "endpoints": {
+            method: {
+                "count": len(values),
+                "errors": errors[method],
+                "p50_ms": percentile(values, 0.5),
+                "p95_ms": percentile(values, 0.95),
+                "p99_ms": percentile(values, 0.99),
+                "max_ms": values[-1],
+            }
+            for method, values in sorted(latencies.items())
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded API trace against a local stand-in")
+    parser.add_argument("trace")
+    parser.add_argument("--sessions", type=int, default=1, help="copies of the recorded sessions run in parallel")
+    parser.add_argument("--concurrency", type=int, default=8, help="calls in flight at most")
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression, 0 sends everything at once")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier of the recorded latencies")
+    parser.add_argument("--daemon", action="store_true", help="go through the daemon's response cache")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = replay(
+        load_trace(args.trace), sessions=args.sessions, concurrency=args.concurrency, speed=args.speed,
+        latency_scale=args.latency_scale, through_daemon=args.daemon,
+    )
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    columns = ["count", "errors", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    print("%-20s" % "endpoint" + "".join("%12s" % col for col in columns))
+    for method, stats in report["endpoints"].items():
+        print("%-20s" % method + "".join("%12.1f" % stats[col] for col in columns))
+    print("%d requests in %.1fs, %.1f/s" % (report["requests"], report["seconds"], report["requests_per_second"]))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main())
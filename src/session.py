@@ -0,0 +1,71 @@
+""" Process-wide API session, user state and caches. Each is created on first
+use, so entry points only pay for (and import) what they touch
+"""
+import threading
+
+import constants
+
+_lock = threading.RLock()
+_api = None
+_user_state = None
+_snapshot_cache = None
+_catalog_mirror = None
+_daemon = False  # not looked for yet
+
+
+def _get_daemon():
+    """ Client of the running daemon, None if there is none or it is disabled """
+    global _daemon  # pylint: disable=global-statement
+    if _daemon is False:
+        _daemon = None
+        if constants.USE_DAEMON:
+            import daemon
+            _daemon = daemon.connect()
+    return _daemon
+
+
+def get_api():
+    """ Logged in CrunchyrollAPI """
+    global _api  # pylint: disable=global-statement
+    with _lock:
+        if _api is None and _get_daemon() is not None:
+            import daemon
+            _api = daemon.RemoteProxy(_get_daemon(), "api")
+        if _api is None:
+            import api.crunchyroll as crapi
+            from config import USER, PASS
+            _api = crapi.CrunchyrollAPI(username=USER, password=PASS, cache_dir=constants.APP_CACHE_DIR)
+            if constants.TRACE_FILE:
+                import replay
+                replay.TraceRecorder(constants.TRACE_FILE).install(_api)
+        return _api
+
+
+def get_user_state():
+    global _user_state  # pylint: disable=global-statement
+    with _lock:
+        if _user_state is None and _get_daemon() is not None:
+            import daemon
+            _user_state = daemon.RemoteProxy(_get_daemon(), "state")
+        if _user_state is None:
+            from user_state import UserState
+            _user_state = UserState(constants.APP_DATA_FILE)
+        return _user_state
+
+
+def get_snapshot_cache():
+    global _snapshot_cache  # pylint: disable=global-statement
+    with _lock:
+        if _snapshot_cache is None:
+            from cache import SnapshotCache
+            _snapshot_cache = SnapshotCache(constants.APP_CACHE_DIR)
+        return _snapshot_cache
+
+
+def get_catalog_mirror():
+    global _catalog_mirror  # pylint: disable=global-statement
+    with _lock:
+        if _catalog_mirror is None:
+            from catalog import CatalogMirror
+            _catalog_mirror = CatalogMirror(constants.APP_CATALOG_DB)
+        return _catalog_mirror
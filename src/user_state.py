@@ -7,13 +7,19 @@ import atexit
 import copy
 from dataclasses import dataclass
 from collections import defaultdict
-from typing import Optional
+from typing import List, Optional
+
+from metrics import registry as metrics
 
 
 class UserState:
     """ User state class """
 
-    CONFIG_TEMPLATE = {"item_history": {}, "playhead": {}}
+    CONFIG_TEMPLATE = {"item_history": {}, "playhead": {}, "series": {}}
+    # lookups get_many can batch
+    BATCHED_GETTERS = {
+        "get_playhead", "get_completed_status", "get_last_accessed", "get_item_last_accessed", "has_new_episodes",
+    }
 
     def __init__(self, state_file_path: str):
         self.state_file_path = state_file_path
@@ -30,12 +36,15 @@ class UserState:
             self.state_file_path = None
             logging.error("State file error (%s), using dummy state file", str(exp))
 
+    @metrics.timed("user_state.save")
     def save_state(self):
         """ Save state to file """
         if self.state_file_path:
             try:
-                with open(self.state_file_path, 'w') as state_file:
+                tmp_path = self.state_file_path + ".tmp"
+                with open(tmp_path, 'w') as state_file:
                     json.dump(self._config, state_file)
+                os.replace(tmp_path, self.state_file_path)
             except Exception as exp:
                 logging.error("Couldn't save state file: %s", str(exp))
 
@@ -63,3 +72,37 @@ class UserState:
         if item not in self._config['item_history']:
             self._config['item_history'][item] = {}
         self._config['item_history'][item].update({'timestamp': int(time.time())})
+
+    def get_series_marker(self, series: str) -> Optional[str]:
+        return self._config['series'].get(series, {}).get('marker')
+
+    def record_series_latest(self, series: str, marker: str, latest_episode: Optional[str]) -> None:
+        """ Record the latest episode of a series found by polling. The first one
+        recorded counts as seen """
+        state = self._config['series'].setdefault(series, {})
+        state['marker'] = marker
+        state['latest'] = latest_episode
+        state.setdefault('seen', latest_episode)
+
+    def mark_series_seen(self, series: str, latest_episode: Optional[str]) -> None:
+        state = self._config['series'].setdefault(series, {})
+        state['latest'] = latest_episode
+        state['seen'] = latest_episode
+
+    def has_new_episodes(self, series: str) -> bool:
+        state = self._config['series'].get(series, {})
+        return state.get('latest') != state.get('seen')
+
+    def get_many(self, getter: str, keys: List[str]) -> list:
+        """ getter applied to every key, in one call (one round trip through the daemon) """
+        if getter not in UserState.BATCHED_GETTERS:
+            raise ValueError("%s can't be batched" % getter)
+        method = getattr(self, getter)
+        return [method(key) for key in keys]
+
+    def get_most_recent_item(self) -> Optional[str]:
+        """ Item accessed last, None if nothing was """
+        history = self._config['item_history']
+        if not history:
+            return None
+        return max(history, key=lambda item: history[item].get('timestamp', 0))
@@ -0,0 +1,80 @@
+""" Worker threads for background work (network calls, playback)
+"""
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+
+class WorkerPool:
+    """ Runs submitted calls on up to max_workers daemon threads. Unlike
+    ThreadPoolExecutor, whose workers are joined at interpreter exit, a task in
+    progress (an episode playing, a hanging request) never holds up quitting
+    """
+
+    def __init__(self, max_workers: int, name: str = "worker"):
+        self.max_workers = max_workers
+        self.name = name
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._idle = 0
+        # submitted calls no worker took yet
+        self._pending = 0
+        self._shutdown = False
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Can't submit to a pool that was shut down")
+            self._queue.put((future, func, args, kwargs))
+            self._pending += 1
+            if self._pending > self._idle and len(self._threads) < self.max_workers:
+                thread = threading.Thread(
+                    target=self._work, name="%s_%d" % (self.name, len(self._threads)), daemon=True
+                )
+                self._threads.append(thread)
+                thread.start()
+        return future
+
+    def map(self, func: Callable, *iterables) -> list:
+        """ Results of func over the arguments, computed concurrently """
+        futures = [self.submit(func, *args) for args in zip(*iterables)]
+        return [future.result() for future in futures]
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                self._idle += 1
+            item = self._queue.get()
+            with self._lock:
+                self._idle -= 1
+                if item is None:
+                    return
+                self._pending -= 1
+            future, func, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as exp:  # pylint: disable=broad-except
+                future.set_exception(exp)
+            else:
+                future.set_result(result)
+
+    def shutdown(self) -> None:
+        """ Cancel the queued calls and let the workers go. Calls in progress
+        are left to finish (or to die with the process) """
+        with self._lock:
+            self._shutdown = True
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[0].cancel()
+            self._pending = 0
+            for _ in self._threads:
+                self._queue.put(None)
@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import logging
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import gui  # noqa: E402
+import headless  # noqa: E402
+
+
+@pytest.fixture
+def backend():
+    backend = headless.HeadlessCurses(lines=30, cols=100)
+    previous = gui.curses
+    gui.use_backend(backend)
+    yield backend
+    gui.use_backend(previous)
+
+
+@pytest.fixture
+def app(backend):
+    from bench import BenchApp
+    return BenchApp(backend)
+
+
+class FakeAPI:
+    """ Stands in for CrunchyrollAPI behind MyApp. Series are listed per filter,
+    queue edits can be slowed down or made to fail """
+
+    def __init__(self):
+        self.series = {}  # filter -> series dicts
+        self.delays = {}  # filter -> seconds list_series takes
+        self.queue = []
+        self.edit_delay = 0.0
+        self.failing = set()  # series ids whose queue edits fail
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def list_series(self, media_type, search_filter, search_filter_param=None, limit=50, offset=0):
+        time.sleep(self.delays.get(search_filter, 0))
+        return self.series.get(search_filter, [])[offset:offset + limit]
+
+    def get_queue(self, media_types, fields=None):
+        return [{"series": series} for series in self.queue]
+
+    def _edit(self, series_id):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.edit_delay)
+            if series_id in self.failing:
+                raise RuntimeError("edit of %s failed" % series_id)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def remove_from_queue(self, series_id):
+        self._edit(series_id)
+        self.queue = [series for series in self.queue if series["series_id"] != series_id]
+
+    def add_to_queue(self, series_id):
+        self._edit(series_id)
+
+
+@pytest.fixture
+def fake_api():
+    return FakeAPI()
+
+
+@pytest.fixture
+def my_app(backend, fake_api, tmp_path, monkeypatch):
+    """ MyApp on the headless backend, with fake_api and user state and caches
+    in tmp_path """
+    pytest.importorskip("requests")
+    import constants
+    import session
+    from cache import SnapshotCache
+    from catalog import CatalogMirror
+    from user_state import UserState
+
+    state_file = tmp_path / "data.json"
+    state_file.write_text("{}")
+    monkeypatch.setattr(constants, "NEW_EPISODE_POLL_INTERVAL", 0)
+    monkeypatch.setattr(session, "_daemon", None)
+    monkeypatch.setattr(session, "_api", fake_api)
+    monkeypatch.setattr(session, "_user_state", UserState(str(state_file)))
+    monkeypatch.setattr(session, "_snapshot_cache", SnapshotCache(str(tmp_path / "cache")))
+    monkeypatch.setattr(session, "_catalog_mirror", CatalogMirror(str(tmp_path / "catalog.db")))
+    import main
+    for name in ("api", "user_state", "snapshot_cache"):
+        monkeypatch.setattr(main, name, getattr(session, "_" + name))
+    monkeypatch.setattr(main, "curses", backend)
+    handlers = logging.getLogger().handlers
+    app = main.MyApp(backend.stdscr)
+    app.root.redraw()
+    yield app
+    app.loop.shutdown()
+    logging.getLogger().handlers = handlers
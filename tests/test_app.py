@@ -0,0 +1,13 @@
+import time
+
+import headless
+
+
+def test_key_frame_latency_doesnt_include_idle_time_after_unbound_key(app):
+    latencies = []
+    app.register_callback("on_key_frame", latencies.append)
+    headless.press(app, ["x"])
+    time.sleep(0.2)
+    headless.press(app, ["j"])
+    assert len(latencies) == 2
+    assert max(latencies) < 0.1
@@ -0,0 +1,63 @@
+import headless
+from gui import Row
+
+
+def _rows(texts):
+    return [Row(idx, text, idx) for idx, text in enumerate(texts)]
+
+
+def test_patch_children_keeps_selection_when_only_the_selected_row_changes(app):
+    widget = app.anime_list_widget
+    widget.patch_children(_rows(["Episode %d" % idx for idx in range(10)]))
+    headless.press(app, [])
+    headless.press(app, ["j", "j"])
+    assert widget.pos == 2
+
+    texts = ["Episode %d" % idx for idx in range(10)]
+    texts[2] += " ✓"
+    assert widget.patch_children(_rows(texts)) == 1
+    headless.press(app, [])
+
+    assert widget.pos == 2
+    assert widget.children[2]._selected  # pylint: disable=protected-access
+    assert any(line.startswith("|Episode 2 ✓") for line in app.stdscr.text())
+
+
+def test_filter_highlight_column_counts_wide_characters(app, monkeypatch):
+    widget = app.anime_list_widget
+    widget.patch_children(_rows(["進撃の巨人 Attack", "Other"]))
+    headless.press(app, [])
+    writes = []
+    original = headless.FakeWindow.addstr
+
+    def _addstr(window, y, x, text, attr=0):
+        writes.append((x, text))
+        original(window, y, x, text, attr)
+
+    monkeypatch.setattr(headless.FakeWindow, "addstr", _addstr)
+    headless.press(app, ["/", "a", "t", "t"])
+    assert widget.filter_query == "att"
+    assert (11, "Att") in writes
+
+
+def test_filter_narrows_and_widens_incrementally(app):
+    widget = app.anime_list_widget
+    widget.patch_children(_rows(["Attack on Titan", "Another", "Bleach", "Ättack again"]))
+    headless.press(app, [])
+    headless.press(app, ["/", "a", "t"])
+    assert list(widget._visible()) == [0, 3]  # pylint: disable=protected-access
+    headless.press(app, ["KEY_BACKSPACE"])
+    assert list(widget._visible()) == [0, 1, 2, 3]  # pylint: disable=protected-access
+    headless.press(app, ["\x1b"])
+    assert widget.filter_query == ""
+    assert len(widget._visible()) == 4  # pylint: disable=protected-access
+
+
+def test_patch_children_reuses_children_by_key(app):
+    widget = app.episode_list_widget
+    widget.patch_children(_rows(["a", "b", "c"]))
+    children = list(widget.children)
+    assert widget.patch_children([Row(2, "c"), Row(0, "a"), Row(3, "d")]) == 1
+    assert widget.children[0] is children[2]
+    assert widget.children[1] is children[0]
+    assert [child.text for child in widget.children] == ["c", "a", "d"]
@@ -0,0 +1,28 @@
+import time
+
+import daemon
+from metrics import registry
+
+
+def test_expired_responses_are_dropped_as_new_ones_are_put():
+    cache = daemon.ResponseCache(ttl=0.05)
+    for page in range(10):
+        cache.put("list_media", str(page), [page])
+    time.sleep(0.06)
+    cache.put("list_media", "fresh", [])
+    assert len(cache) == 1
+    assert cache.get("list_media", "fresh") == (True, [])
+
+
+class _Client:
+    def call(self, target, method, *args, **kwargs):
+        return target, method, args
+
+
+def test_api_calls_through_the_daemon_are_timed_by_the_client():
+    proxy = daemon.RemoteProxy(_Client(), "api")
+    count = registry.histograms["api.get_queue"].count if "api.get_queue" in registry.histograms else 0
+    assert proxy.get_queue("anime") == ("api", "get_queue", ("anime",))
+    assert registry.histograms["api.get_queue"].count == count + 1
+    daemon.RemoteProxy(_Client(), "state").get_playhead("ep")
+    assert "api.get_playhead" not in registry.histograms
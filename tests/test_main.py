@@ -0,0 +1,157 @@
+import time
+
+import headless
+from api.crunchyroll import Filters
+from media import CRAnime, Episode
+
+
+def _series(*names):
+    return [{"series_id": str(idx), "name": name} for idx, name in enumerate(names)]
+
+
+def _catalog(my_app, name):
+    catalog = my_app.root_directory.children[1]
+    return next(directory for directory in catalog.children if directory.get_name() == name)
+
+
+def test_slow_directory_doesnt_replace_the_one_opened_after_it(my_app, fake_api):
+    popular, simulcasts = _catalog(my_app, "Popular"), _catalog(my_app, "Simulcasts")
+    fake_api.series[Filters.POPULAR] = _series("Popular show")
+    fake_api.delays[Filters.POPULAR] = 0.3
+    fake_api.series[Filters.SIMULCAST] = _series("Simulcast show")
+    my_app.open_directory(popular)
+    my_app.open_directory(simulcasts)
+    headless.run_for(my_app, 0.5)
+    assert my_app.anime_list_widget.get_data() is simulcasts
+    assert [child.text for child in my_app.anime_list_widget.children] == ["<- (Back)", "Simulcast show"]
+
+
+def test_holding_up_at_the_top_loads_every_previous_page(my_app, fake_api):
+    fake_api.series[Filters.ALPHA] = _series(*("Show %03d" % idx for idx in range(300)))
+    alphabetical = _catalog(my_app, "Alphabetical")
+    alphabetical.get_content()
+    for _ in range(5):
+        alphabetical.load_next()
+    assert list(alphabetical._pages) == [2, 3, 4, 5]  # pylint: disable=protected-access
+    my_app.show_directory(alphabetical, alphabetical._content())  # pylint: disable=protected-access
+    headless.press(my_app, ["KEY_HOME"])
+    for _ in range(5):
+        headless.press(my_app, ["k"])
+        headless.run_for(my_app, 0.05)
+    assert list(alphabetical._pages) == [0, 1, 2, 3]  # pylint: disable=protected-access
+    assert my_app.anime_list_widget.pos == 0
+
+
+def _open_queue(my_app, fake_api, count):
+    fake_api.queue = _series(*("Show %02d" % idx for idx in range(count)))
+    my_app.open_directory(my_app.queue_directory)
+    headless.run_for(my_app, 0.05)
+    return my_app.anime_list_widget
+
+
+def _shown(widget):
+    return [child.text for child in widget.children if child.text != "<- (Back)"]
+
+
+def test_removed_series_disappear_before_the_api_answers(my_app, fake_api):
+    widget = _open_queue(my_app, fake_api, 3)
+    fake_api.edit_delay = 0.2
+    headless.press(my_app, ["KEY_HOME", "j", " ", " "])
+    my_app.delete_entry(widget)
+    headless.press(my_app, [])
+    assert _shown(widget) == ["Show 02"]
+    assert len(fake_api.queue) == 3
+    headless.run_for(my_app, 0.3)
+    assert _shown(widget) == ["Show 02"]
+    assert [series["name"] for series in fake_api.queue] == ["Show 02"]
+
+
+def test_failed_removals_are_put_back(my_app, fake_api):
+    widget = _open_queue(my_app, fake_api, 3)
+    fake_api.failing = {"1"}
+    headless.press(my_app, ["*"])
+    my_app.delete_entry(widget)
+    headless.run_for(my_app, 0.1)
+    assert _shown(widget) == ["Show 01"]
+
+
+def test_bulk_removal_runs_the_edits_concurrently(my_app, fake_api):
+    widget = _open_queue(my_app, fake_api, 17)
+    fake_api.edit_delay = 0.1
+    headless.press(my_app, ["KEY_HOME", "j", " "])
+    my_app.delete_entry(widget)
+    headless.run_for(my_app, 0.15)
+    headless.press(my_app, ["*"])
+    start = time.perf_counter()
+    my_app.delete_entry(widget)
+    while _shown(widget) or fake_api.queue:
+        headless.run_for(my_app, 0.01)
+        assert time.perf_counter() - start < 1
+    assert fake_api.max_in_flight == my_app.mutations._executor.max_workers == 8  # pylint: disable=protected-access
+    assert time.perf_counter() - start < 0.35
+
+
+class _Episode(Episode):
+    def __init__(self, number, user_state=None):
+        self.number = number
+        self.user_state = user_state
+
+    def get_id(self):
+        return "ep-%d" % self.number
+
+    def get_number(self):
+        return str(self.number)
+
+    def get_name(self):
+        return "Episode %d" % self.number
+
+    def get_collection(self):
+        return None
+
+    def open(self):
+        self.user_state.record_history(self.get_id(), 1400, 1420)
+
+
+def test_episode_is_marked_watched_after_the_list_was_refetched_during_playback(my_app):
+    import main
+    anime = CRAnime({"series_id": "1", "name": "Show"})
+    episodes = [_Episode(number, main.user_state) for number in (1, 2)]
+    my_app.show_episodes(anime, episodes, {})
+    headless.press(my_app, ["l", "KEY_HOME", "\n"])
+    my_app.show_episodes(anime, [_Episode(number) for number in (1, 2)], {})
+    headless.run_for(my_app, 0.05)
+    assert my_app.episode_list_widget.children[0].text.startswith("1   ✓")
+
+
+def test_alphabetical_catalog_is_read_from_the_mirror_once_filled(my_app, fake_api):
+    import session
+    alphabetical = _catalog(my_app, "Alphabetical")
+    fake_api.series[Filters.ALPHA] = _series("From the network")
+    my_app.open_directory(alphabetical)
+    headless.run_for(my_app, 0.05)
+    assert _shown(my_app.anime_list_widget) == ["From the network"]
+
+    session.get_catalog_mirror().upsert_series(_series("Naruto", "Bleach"))
+    my_app.open_directory(alphabetical)
+    headless.run_for(my_app, 0.05)
+    assert _shown(my_app.anime_list_widget) == ["Bleach", "Naruto"]
+
+
+def test_search_is_answered_by_the_mirror_as_the_query_is_typed(my_app, fake_api):
+    import session
+    session.get_catalog_mirror().upsert_series([
+        {"series_id": "1", "name": "Attack on Titan"},
+        {"series_id": "2", "name": "Bleach", "description": "A teen can see ghosts"},
+        {"series_id": "3", "name": "Titan Girls"},
+    ])
+    widget = my_app.anime_list_widget
+    my_app.open_directory(_catalog(my_app, "Search"))
+    headless.run_for(my_app, 0.05)
+    assert widget.filtering and _shown(widget) == []
+    headless.press(my_app, list("titan"))
+    assert sorted(_shown(widget)) == ["Attack on Titan", "Titan Girls"]
+    headless.press(my_app, ["KEY_BACKSPACE"] * 5 + list("ghost"))
+    assert _shown(widget) == ["Bleach"]
+    headless.press(my_app, ["\n"])
+    assert not widget.filtering
+    assert widget.get_selected_item().get_data().get_id() == "CR-2"
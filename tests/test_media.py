@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("requests")
+
+from media import merge_locales  # noqa: E402
+
+
+def _episode(media_id, number, collection, name, available=True):
+    return {
+        "media_id": media_id, "episode_number": number, "collection_id": collection,
+        "name": name, "url": "https://example.com/" + media_id, "available": available,
+    }
+
+
+def test_merge_locales_keys_by_collection_and_number():
+    episodes = merge_locales({
+        "enUS": [_episode("2", "2", "c1", "Two"), _episode("1", "1", "c1", "One")],
+        "deDE": [
+            _episode("2", "2", "c1", "Zwei", available=False),
+            _episode("1", "1", "c1", "Eins"),
+            _episode("9", "1", "c2", "Eins (Dub)"),
+        ],
+    }, "CR-5")
+    assert [(episode.get_id(), episode.get_collection()) for episode in episodes] == [
+        ("CR-2", "c1"), ("CR-1", "c1"), ("CR-9", "c2"),
+    ]
+    assert episodes[0].get_name() == "Two"
+    assert episodes[0].variant("deDE").get_name() == "Zwei"
+    assert episodes[0].get_available_locales() == ["enUS"]
+    assert episodes[1].get_available_locales() == ["enUS", "deDE"]
+    assert episodes[2].variant("enUS") is episodes[2]
@@ -0,0 +1,78 @@
+import time
+import socket
+import threading
+
+import pytest
+
+import player
+
+
+class _FakeMpv:
+    """ Listens on an mpv IPC socket and records the commands it gets """
+
+    def __init__(self, path):
+        self.commands = []
+        self.connections = 0
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        self._server.listen()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            conn, _ = self._server.accept()
+            self.connections += 1
+            threading.Thread(target=self._read, args=(conn,), daemon=True).start()
+
+    def _read(self, conn):
+        for line in conn.makefile("rb"):
+            self.commands.append(line)
+
+    def received(self, text, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if any(text in command for command in self.commands):
+                return True
+            time.sleep(0.01)
+        return False
+
+
+class _DeadProcess:
+    pid = 0
+
+    def __init__(self, args, **kwargs):
+        self.args = args
+
+    def poll(self):
+        return 1
+
+
+@pytest.fixture
+def mpv_socket(tmp_path):
+    path = str(tmp_path / "mpv.sock")
+    return path, _FakeMpv(path)
+
+
+def test_mpv_left_by_a_crashed_run_is_adopted_and_quit(mpv_socket):
+    path, mpv = mpv_socket
+    mpv_player = player.MpvPlayer(path)
+    with mpv_player._lock:  # pylint: disable=protected-access
+        mpv_player._spawn()  # pylint: disable=protected-access
+    assert mpv.connections == 1
+    mpv_player.shutdown()
+    assert mpv.received(b'"quit"')
+
+
+def test_mpv_of_a_live_client_is_left_alone(mpv_socket, monkeypatch):
+    path, mpv = mpv_socket
+    owner = player.MpvPlayer(path)
+    owner._claim()  # pylint: disable=protected-access
+    spawned = []
+    monkeypatch.setattr(player.subprocess, "Popen", lambda args, **kwargs: spawned.append(args) or _DeadProcess(args))
+    other = player.MpvPlayer(path)
+    with pytest.raises(player.PlayerError):
+        other._spawn()  # pylint: disable=protected-access
+    other.shutdown()
+    assert mpv.connections == 0
+    assert spawned[0][1] == "--input-ipc-server=%s.%d" % (path, player.os.getpid())
+    owner.shutdown()
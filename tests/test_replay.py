@@ -0,0 +1,18 @@
+import pytest
+
+replay = pytest.importorskip("replay")
+
+
+def test_percentile_is_an_observed_latency():
+    latencies = sorted([101.0] * 99 + [5000.0])
+    assert replay.percentile(latencies, 0.5) == 101.0
+    assert replay.percentile(latencies, 0.99) == 101.0
+    assert replay.percentile(latencies, 1.0) == 5000.0
+
+
+def test_percentile_nearest_rank():
+    latencies = [float(ms) for ms in range(1, 21)]
+    assert replay.percentile(latencies, 0.5) == 10.0
+    assert replay.percentile(latencies, 0.95) == 19.0
+    assert replay.percentile(latencies, 0.0) == 1.0
+    assert replay.percentile([], 0.5) == 0.0
@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+from api.search_index import SearchIndex, iter_series, write_index
+
+
+def _payload(entries):
+    body = json.dumps({"result_code": 1, "message_list": [], "data": entries})
+    return ("/*-secure-\n" + body + "\n*/").encode()
+
+
+SERIES = [
+    {"type": "Series", "id": str(idx), "name": "Nämé %d" % idx, "link": "/s%d" % idx, "img": "x"}
+    for idx in range(50)
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64 * 1024])
+def test_iter_series_parses_across_chunk_boundaries(chunk_size):
+    payload = _payload(SERIES + [{"type": "Person", "id": "p", "name": "Someone"}])
+    chunks = [payload[idx:idx + chunk_size] for idx in range(0, len(payload), chunk_size)]
+    series = list(iter_series(chunks))
+    assert len(series) == 50
+    assert series[3] == {"id": "3", "name": "Nämé 3", "link": "/s3"}
+
+
+def test_index_round_trip_and_search(tmp_path):
+    path = str(tmp_path / "index.bin")
+    assert write_index(path, iter_series([_payload(SERIES)])) == 50
+    index = SearchIndex(path)
+    assert len(index) == 50
+    assert index[0] == {"id": "0", "name": "Nämé 0", "link": "/s0", "type": "Series"}
+    assert [series["id"] for series in index.search("NÄMÉ 4")] == ["4"] + [str(idx) for idx in range(40, 50)]
+    assert index.search("nothing") == []
@@ -0,0 +1,19 @@
+from gui import Table
+
+
+def test_columns_are_aligned_by_display_width():
+    table = Table(3, padding=1, min_widths=(0, 1, 0))
+    table.append(("1", "", "First"))
+    table.append(("12", "✓", "進撃"))
+    assert table.render() == ["1    First", "12 ✓ 進撃"]
+
+
+def test_set_row_reports_width_changes():
+    table = Table(2, padding=1)
+    table.append(("1", "a"))
+    table.append(("22", "b"))
+    assert not table.set_row(0, ("3", "c"))
+    assert table.render_row(0) == "3  c"
+    assert table.set_row(1, ("4", "b"))
+    assert table.render() == ["3 c", "4 b"]
+    assert table.get_row(1) == ("4", "b")
@@ -0,0 +1,41 @@
+import threading
+import time
+
+from workers import WorkerPool
+
+
+def test_burst_after_warm_up_runs_at_max_workers():
+    pool = WorkerPool(8, "test")
+    pool.submit(lambda: None).result()
+    running = []
+    lock = threading.Lock()
+
+    def _task():
+        with lock:
+            running.append(threading.current_thread().name)
+        time.sleep(0.2)
+
+    start = time.perf_counter()
+    futures = [pool.submit(_task) for _ in range(16)]
+    for future in futures:
+        future.result()
+    assert time.perf_counter() - start < 0.6
+    assert len(set(running)) == 8
+    pool.shutdown()
+
+
+def test_shutdown_cancels_queued_calls():
+    pool = WorkerPool(1, "test")
+    started, gate = threading.Event(), threading.Event()
+
+    def _blocking():
+        started.set()
+        return gate.wait()
+
+    first = pool.submit(_blocking)
+    started.wait()
+    queued = pool.submit(lambda: None)
+    pool.shutdown()
+    gate.set()
+    assert first.result() is True
+    assert queued.cancelled()